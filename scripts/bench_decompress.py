@@ -0,0 +1,152 @@
+"""Compare serial and parallel block decompression of bundles.
+
+Usage: python scripts/bench_decompress.py [--workers N] [BUNDLE ...]
+
+The parallel loads use N workers (default 4), whatever the CPU count; on a
+single CPU they cannot be faster. Only LZ4 bundles take the parallel path,
+the "parallel" column says whether a bundle did. Without bundles, LZ4
+bundles of typical sizes (an icon pack, a char arts bundle and an audio
+bundle) are generated in a temporary directory.
+
+It first measures how long each decompressor keeps other threads waiting,
+which is the whole call for one that holds the GIL.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import lz4.block
+import lz4inv
+import numpy as np
+from UnityPy.enums import ArchiveFlags
+from UnityPy.files import BundleFile
+from UnityPy.files.File import File
+from UnityPy.streams import EndianBinaryWriter
+
+from torappu import get_config
+from torappu.core import bundle as bundle_module
+from torappu.core.bundle import load_bundle
+
+SIZES = [8 << 20, 64 << 20, 256 << 20]
+ROUNDS = 3
+
+config = get_config()
+config.bundle_cache_size = 0
+
+
+def make_bundle(path: Path, size: int):
+    rng = np.random.default_rng(size)
+    # runs of repeated bytes, so LZ4 has something to do
+    data = np.repeat(rng.integers(0, 256, size // 8, dtype=np.uint8), 8).tobytes()
+
+    bundle = BundleFile.__new__(BundleFile)
+    File.__init__(bundle)
+    bundle.signature = "UnityFS"
+    bundle.version = 7
+    bundle.version_player = "5.x.x"
+    bundle.version_engine = "2021.3.1f1"
+    bundle.dataflags = ArchiveFlags(0)
+    bundle._uses_block_alignment = True
+    writer = EndianBinaryWriter()
+    writer.write(data)
+    writer.flags = 0
+    bundle.files = {"CAB-bench.resS": writer}
+    path.write_bytes(bundle.save(packer="lz4"))
+
+
+def literal_block(data: bytes) -> bytes:
+    """lz4inv block storing `data` as literals; its token nibbles are swapped"""
+    length = len(data) - 15
+    return b"\x0f" + b"\xff" * (length // 255) + bytes([length % 255]) + data
+
+
+def longest_stall(func: Callable[[], object]) -> float:
+    """Longest the main thread waits for the GIL while `func` runs on another"""
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (func(), done.set()))
+    last, longest = time.perf_counter(), 0.0
+    thread.start()
+    while not done.is_set():
+        now = time.perf_counter()
+        longest = max(longest, now - last)
+        last = now
+    thread.join()
+    return longest
+
+
+def bench_gil(size: int = 64 << 20):
+    data = np.random.default_rng(0).integers(0, 256, size, dtype=np.uint8).tobytes()
+    compressed = {
+        "lz4": (lz4.block.decompress, lz4.block.compress(data, store_size=False)),
+        "lz4inv (LZHAM)": (lz4inv.decompress_buffer, literal_block(data)),
+    }
+    print(f"{'decompressor':<24} {'call':>10} {'longest stall':>14}")
+    for name, (decompress, block) in compressed.items():
+        assert decompress(block, size) == data
+        start = time.perf_counter()
+        decompress(block, size)
+        call = time.perf_counter() - start
+        stall = longest_stall(lambda: decompress(block, size))
+        print(f"{name:<24} {call * 1000:>8.1f}ms {stall * 1000:>12.1f}ms")
+    print()
+
+
+def bench(path: str, workers: int) -> tuple[float, bool]:
+    config.decompress_workers = workers
+    executor = bundle_module.decompress_executor
+    parallel = False
+
+    def spy(*args, **kwargs):
+        nonlocal parallel
+        parallel = True
+        return executor_map(*args, **kwargs)
+
+    executor_map, executor.map = executor.map, spy
+    best = float("inf")
+    try:
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            load_bundle(path)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        del executor.map
+
+    return best, parallel
+
+
+def run(paths: list[str], workers: int):
+    print(f"{os.cpu_count()} CPUs, {workers} workers")
+    print(
+        f"{'bundle':<40} {'size':>10} {'serial':>10} {'parallel':>10} {'parallel':>9}"
+    )
+    for path in paths:
+        size = Path(path).stat().st_size
+        serial, _ = bench(path, 1)
+        parallel, used = bench(path, workers)
+        print(
+            f"{Path(path).name:<40} {size >> 20:>8}MB "
+            f"{serial * 1000:>8.1f}ms {parallel * 1000:>8.1f}ms {used!s:>9}"
+        )
+
+
+args = sys.argv[1:]
+workers = 4
+if args[:1] == ["--workers"]:
+    workers, args = int(args[1]), args[2:]
+
+bench_gil()
+if args:
+    run(args, workers)
+else:
+    with TemporaryDirectory() as temp_dir:
+        paths = []
+        for size in SIZES:
+            path = Path(temp_dir) / f"lz4_{size >> 20}m"
+            make_bundle(path, size)
+            paths.append(str(path))
+        run(paths, workers)
@@ -0,0 +1,118 @@
+"""Compare the integer kernels of `torappu.core.imageops` with the float32 / PIL
+implementations they replaced.
+
+Usage: python scripts/bench_imageops.py [SIZE ...]
+
+Sizes are edge lengths of square test images (default: 1024 2048 4096). The
+alpha texture is half the size of the colour texture, as in spine atlases.
+Memory is the peak of allocations visible to tracemalloc, which excludes
+PIL's internal image buffers.
+"""
+
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import numpy as np
+from PIL import Image
+
+from torappu.core import imageops
+
+SIZES = [1024, 2048, 4096]
+ROUNDS = 3
+
+
+def legacy_premultiply(rgba: Image.Image) -> Image.Image:
+    data = np.array(rgba.convert("RGBA"), dtype=np.float32)
+    data[:, :, :3] *= data[:, :, 3:] / 255.0
+    return Image.fromarray(np.clip(data, 0, 255).astype(np.uint8), "RGBA")
+
+
+def legacy_merge(rgb: Image.Image, alpha: Image.Image) -> Image.Image:
+    r, g, b = rgb.split()[:3]
+    a, *_ = alpha.resize(rgb.size).split()
+    return Image.merge("RGBA", (r, g, b, a))
+
+
+def legacy_crop(image: Image.Image, box: tuple[int, int, int, int]) -> Image.Image:
+    return image.crop(box).rotate(-90, expand=True)
+
+
+def premultiply(rgba: Image.Image) -> Image.Image:
+    return Image.fromarray(imageops.premultiply(np.array(rgba)), "RGBA")
+
+
+def merge(rgb: Image.Image, alpha: Image.Image) -> Image.Image:
+    # merge_alpha stays with PIL, which beats a NumPy copy of the channels
+    merged = rgb.copy()
+    merged.putalpha(alpha.resize(rgb.size).getchannel(0))
+    return merged
+
+
+def crop(data: np.ndarray, box: tuple[int, int, int, int]) -> Image.Image:
+    return Image.fromarray(imageops.crop(data, box, rotate=True))
+
+
+def measure(func: Callable[[], Image.Image]) -> tuple[float, int, Image.Image]:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    # NumPy reports its buffers to tracemalloc; PIL's own are not counted
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak, result
+
+
+def compare(
+    name: str, legacy: Callable[[], Image.Image], new: Callable[[], Image.Image]
+):
+    old_time, old_peak, old_result = measure(legacy)
+    new_time, new_peak, new_result = measure(new)
+    diff = np.abs(
+        np.asarray(old_result, dtype=np.int16) - np.asarray(new_result, dtype=np.int16)
+    ).max()
+    print(
+        f"{name:<24} {old_time * 1000:>9.1f}ms {new_time * 1000:>9.1f}ms "
+        f"{old_peak >> 20:>8}MB {new_peak >> 20:>8}MB {diff:>9}"
+    )
+
+
+def run(size: int):
+    rng = np.random.default_rng(size)
+    rgba = Image.fromarray(rng.integers(0, 256, (size, size, 4), dtype=np.uint8))
+    # both resize alpha with PIL, so any alpha texture must give the same result
+    alpha = Image.fromarray(
+        rng.integers(0, 256, (size // 2, size // 2, 4), dtype=np.uint8)
+    )
+    # atlas regions are cut from an image that is already an array
+    data = np.asarray(rgba)
+    box = (size // 8, size // 4, size - size // 8, size - size // 4)
+
+    compare(
+        f"premultiply {size}",
+        lambda: legacy_premultiply(rgba),
+        lambda: premultiply(rgba),
+    )
+    compare(
+        f"merge alpha {size}",
+        lambda: legacy_merge(rgba, alpha),
+        lambda: merge(rgba, alpha),
+    )
+    compare(
+        f"crop+rotate {size}", lambda: legacy_crop(rgba, box), lambda: crop(data, box)
+    )
+
+
+print(
+    f"{'kernel':<24} {'legacy':>11} {'integer':>11} "
+    f"{'legacy':>10} {'integer':>10} {'max diff':>9}"
+)
+for size in map(int, sys.argv[1:]) if len(sys.argv) > 1 else SIZES:
+    run(size)
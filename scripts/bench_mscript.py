@@ -0,0 +1,141 @@
+"""Compare the memory the GameData decoders use with and without m_Script str.
+
+Usage: python scripts/bench_mscript.py
+
+Generates the raw data of TextAssets of typical sizes holding a signed,
+encrypted BSON table and a signed BSON level, and decodes them the way
+GameData used to (m_Script decoded to str by UnityPy, then encoded back and
+copied for each step) and the way it does now (views of the raw data).
+Peak traced allocations exclude the raw data and the output.
+"""
+
+import json
+import struct
+import time
+import tracemalloc
+
+import bson
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+from torappu.core.task.gamedata import chat_mask, unpadded
+from torappu.core.task.utils import RawScript, m_script_to_bytes
+
+SIZES = [1 << 20, 8 << 20]
+
+
+def make_table(size: int) -> dict:
+    row = {"name": "x" * 40, "values": list(range(16)), "text": "干员" * 8}
+    return {f"row_{i}": row for i in range(size // 250)}
+
+
+def make_raw(script: bytes) -> bytes:
+    name = b"table"
+    return b"".join(
+        [
+            struct.pack("<i", len(name)),
+            name,
+            b"\0" * (-len(name) % 4),
+            struct.pack("<i", len(script)),
+            script,
+        ]
+    )
+
+
+def encrypt(data: bytes) -> bytes:
+    key = chat_mask[:16].encode()
+    mask = chat_mask[16:].encode()
+    iv = bytes(16)
+    cipher = AES.new(key, AES.MODE_CBC, iv=iv).encrypt(pad(bytes(16) + data, 16))
+    first = bytes(a ^ b for a, b in zip(cipher[:16], mask))
+    return b"\0" * 128 + first + cipher[16:]
+
+
+def legacy_decrypt(raw: bytes) -> bytes:
+    (size,) = struct.unpack_from("<i", raw, 12)
+    # UnityPy decodes m_Script to str when the object is read
+    m_script = bytes(raw[16 : 16 + size]).decode("utf-8", "surrogateescape")
+    m_script_to_bytes(m_script)  # _unpack_gamedata
+    cipher_data = bytearray(m_script_to_bytes(m_script))[128:]
+    iv = chat_mask[16:].encode()
+    for i in range(16):
+        cipher_data[i] ^= iv[i]
+    cipher = AES.new(chat_mask[:16].encode(), AES.MODE_CBC)
+    decipher = unpad(bytes(cipher.decrypt(cipher_data)), 16)
+    return json.dumps(
+        bson.decode_document(decipher[16:], 0)[1],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def current_decrypt(raw: bytes) -> bytes:
+    (size,) = struct.unpack_from("<i", raw, 12)
+    script = RawScript("table", memoryview(raw), 16, 16 + size)
+    cipher_data = script.view(128)
+    iv = bytes(a ^ b for a, b in zip(cipher_data[:16], chat_mask[16:].encode()))
+    cipher = AES.new(chat_mask[:16].encode(), AES.MODE_CBC, iv=iv)
+    decipher = cipher.decrypt(cipher_data[16:])
+    unpadded(decipher)
+    return json.dumps(
+        bson.decode_document(decipher, 0)[1],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def legacy_level(raw: bytes) -> bytes:
+    (size,) = struct.unpack_from("<i", raw, 12)
+    m_script = bytes(raw[16 : 16 + size]).decode("utf-8", "surrogateescape")
+    script = m_script_to_bytes(m_script)
+    return json.dumps(
+        bson.decode_document(bytes(script)[128:], 0)[1],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def current_level(raw: bytes) -> bytes:
+    (size,) = struct.unpack_from("<i", raw, 12)
+    script = RawScript("level", memoryview(raw), 16, 16 + size)
+    return json.dumps(
+        bson.decode_document(bytes(script.view(128)), 0)[1],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def measure(decode, raw: bytes) -> tuple[bytes, float, int]:
+    start = time.perf_counter()
+    decode(raw)
+    elapsed = time.perf_counter() - start
+
+    # tracing slows the decoders down too much to time them at once
+    tracemalloc.start()
+    result = decode(raw)
+    peak = tracemalloc.get_traced_memory()[1] - len(result)
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    for size in SIZES:
+        document = bson.dumps(make_table(size))
+        cases = {
+            "encrypted": (make_raw(encrypt(document)), legacy_decrypt, current_decrypt),
+            "level": (make_raw(b"\0" * 128 + document), legacy_level, current_level),
+        }
+        print(f"{len(document) / (1 << 20):.1f} MiB of BSON")
+        for name, (raw, legacy, current) in cases.items():
+            old, old_time, old_peak = measure(legacy, raw)
+            new, new_time, new_peak = measure(current, raw)
+            assert old == new
+            print(
+                f"  {name:<10} peak {old_peak / (1 << 20):6.1f} MiB ->"
+                f" {new_peak / (1 << 20):6.1f} MiB,"
+                f" {old_time * 1000:6.1f} ms -> {new_time * 1000:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare loading a whole gamedata table with loading a few of its fields.
+
+Usage: python scripts/bench_projection.py [TABLE FIELD ...]
+
+Without arguments, a character table of typical size is generated in a
+temporary directory and projected to `*.name`. Each loader runs in a fresh
+process, so the peak resident memory of one does not hide the other.
+"""
+
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from torappu.core.projection import load_projected
+
+ROUNDS = 3
+
+
+def make_table(path: Path):
+    rng = random.Random(0)
+
+    def blackboard():
+        return [{"key": f"k{i}", "value": rng.random()} for i in range(8)]
+
+    table = {
+        f"char_{i:04d}": {
+            "name": f"char {i}",
+            "description": "x" * 200,
+            "phases": [
+                {
+                    "attributesKeyFrames": [
+                        {"level": level, "data": {"maxHp": rng.randint(1, 5000)}}
+                        for level in range(4)
+                    ],
+                    "evolveCost": [{"id": "3301", "count": 3, "type": "MATERIAL"}],
+                }
+                for _ in range(3)
+            ],
+            "talents": [{"candidates": [{"blackboard": blackboard()}]}] * 3,
+            "skills": [{"skillId": f"skchr_{i}_{s}"} for s in range(3)],
+        }
+        for i in range(1200)
+    }
+    path.write_text(json.dumps(table), "utf-8")
+
+
+def run(table: str, fields: list[str]):
+    data = Path(table).read_bytes()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = load_projected(data, *fields) if fields else json.loads(data)
+        del result
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(f"{elapsed * 1000:.1f} {peak / 1024:.1f}")
+
+
+def measure(table: str, fields: list[str]) -> str:
+    output = subprocess.run(
+        [sys.executable, __file__, "--run", table, *fields],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    elapsed, peak = output.split()
+    return f"{elapsed:>8} ms {peak:>8} MiB"
+
+
+def compare(table: str, fields: list[str]):
+    size = Path(table).stat().st_size / (1 << 20)
+    print(f"{table} ({size:.1f} MiB)")
+    print(f"  json.loads      {measure(table, [])}")
+    print(f"  {' '.join(fields):<15} {measure(table, fields)}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], sys.argv[3:])
+    elif len(sys.argv) > 2:
+        compare(sys.argv[1], sys.argv[2:])
+    else:
+        with TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "character_table.json"
+            make_table(path)
+            compare(str(path), ["*.name"])
@@ -0,0 +1,21 @@
+"""Write a version of the gamedata store as a plain tree of files.
+
+Usage: python scripts/export_gamedata.py [RES_VERSION] [DEST]
+
+RES_VERSION defaults to the last version stored, and DEST to its usual
+place under storage/asset/gamedata.
+"""
+
+import sys
+from pathlib import Path
+
+from torappu.consts import GAMEDATA_DIR
+from torappu.core import gamedata_store
+
+if __name__ == "__main__":
+    res_version = (
+        sys.argv[1] if len(sys.argv) > 1 else gamedata_store.LATEST_PATH.read_text()
+    )
+    dest = Path(sys.argv[2]) if len(sys.argv) > 2 else GAMEDATA_DIR / res_version
+    gamedata_store.export(res_version, dest)
+    print(f"Exported gamedata {res_version} to {dest}")
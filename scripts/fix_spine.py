@@ -1,42 +1,22 @@
-import json
+"""Check the exported character skeletons for missing or broken files.
 
-from torappu.consts import STORAGE_DIR
+Usage: python scripts/fix_spine.py [CHAR ...]
 
-BASE_DIR = STORAGE_DIR / "asset" / "raw" / "char_spine"
+Without arguments, every character under `char_spine` is checked. The report
+is printed as JSON and the exit status is 1 when there are issues.
+"""
 
+import sys
 
-def check(file_path: str):
-    skel_path = (dir / file_path).with_suffix(".skel")
-    if not skel_path.is_file():
-        print(f"Missing file: {skel_path}")
-    atlas_path = (dir / file_path).with_suffix(".atlas")
-    if atlas_path.is_file():
-        try:
-            with open(atlas_path, encoding="utf-8") as atlas_file:
-                lines = atlas_file.readlines()
-                if len(lines) >= 2:
-                    img_path = (dir / file_path).parent / lines[1].strip()
-                    if not img_path.is_file():
-                        print(f"Missing image file: {img_path}")
-                else:
-                    print(f"Atlas file has fewer than 2 lines: {atlas_path}")
-        except Exception as e:
-            print(f"Error reading atlas file {atlas_path}: {e}")
-    else:
-        print(f"Missing file: {atlas_path}")
+from torappu.core.spine_check import check_chars
+from torappu.core.task.char_spine import BASE_DIR
 
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        char_dirs = [BASE_DIR / char for char in sys.argv[1:]]
+    else:
+        char_dirs = [path for path in BASE_DIR.iterdir() if path.is_dir()]
 
-for dir in BASE_DIR.iterdir():
-    if dir.is_dir():
-        meta_path = dir / "meta.json"
-        if not meta_path.is_file():
-            print(f"Missing file: {meta_path}")
-            continue
-        with open(meta_path) as file:
-            meta = json.loads(file.read())
-            # Iterate through skin types (e.g., "默认", "拭刀")
-            for skin_name, skin_poses in meta.get("skin", {}).items():
-                # Iterate through pose types (e.g., "正面", "背面", "基建")
-                for pose_name, pose_data in skin_poses.items():
-                    file_path: str = pose_data.get("file", "")
-                    check(file_path)
+    report = check_chars(char_dirs)
+    print(report.model_dump_json(indent=2))
+    sys.exit(1 if report.issues else 0)
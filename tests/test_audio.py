@@ -0,0 +1,71 @@
+import math
+import shutil
+import struct
+import wave
+from io import BytesIO
+from pathlib import Path
+
+import anyio
+import pytest
+
+from torappu.core.task import audio
+from torappu.core.task.audio import Audio
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+RATE = 8000
+
+
+def make_wav(frequency: int, seconds: float = 0.5) -> bytes:
+    samples = (
+        round(8000 * math.sin(2 * math.pi * frequency * i / RATE))
+        for i in range(int(RATE * seconds))
+    )
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(b"".join(struct.pack("<h", sample) for sample in samples))
+    return buffer.getvalue()
+
+
+async def encode_all(samples: list[tuple[bytes, Path]]):
+    task = Audio(None)  # type: ignore
+    async with anyio.create_task_group() as tg:
+        for data, path in samples:
+            await task.encode_slots.acquire()
+            tg.start_soon(task.encode, data, path, "digest")
+
+
+def test_encode_samples_of_one_clip(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(audio.config, "keep_wav", True)
+    monkeypatch.setattr(audio.config, "audio_workers", 4)
+    path, alone = tmp_path / "clip.wav", tmp_path / "alone.wav"
+    # the last sample is the quickest to encode
+    samples = [make_wav(220, 4), make_wav(440, 4), make_wav(880)]
+
+    anyio.run(encode_all, [(data, path) for data in samples])
+    anyio.run(encode_all, [(samples[-1], alone)])
+
+    # the last sample wins, as when they were encoded one after another
+    assert path.read_bytes() == samples[-1]
+    assert (
+        path.with_suffix(".mp3").read_bytes() == alone.with_suffix(".mp3").read_bytes()
+    )
+    assert path.with_suffix(".sha256").read_text() == "digest"
+
+
+@pytest.mark.parametrize("keep_wav", [True, False])
+def test_concat(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, keep_wav: bool):
+    monkeypatch.setattr(audio.config, "keep_wav", keep_wav)
+    intro, loop = tmp_path / "intro.wav", tmp_path / "loop.wav"
+    anyio.run(encode_all, [(make_wav(440), intro), (make_wav(660), loop)])
+    clips = [intro.with_suffix(".mp3"), loop.with_suffix(".mp3")]
+    dest = tmp_path / "bank.mp3"
+
+    assert anyio.run(Audio(None).concat, clips, dest)  # type: ignore
+    assert dest.stat().st_size > max(clip.stat().st_size for clip in clips)
+    assert not dest.with_name(".bank.mp3").exists()
@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import anyio
+import httpx
+import pytest
+from tenacity import wait_none
+
+from torappu.core.task import item_demand
+from torappu.core.task.item_demand import ItemDemand, dump_demand
+
+ENDPOINT = "http://backend.test"
+DEMAND = {"item": {"char_002_amiya": {"elite": 1}}}
+
+
+class Backend:
+    """Stand-in backend answering each request with the next status"""
+
+    def __init__(self, *statuses: int, accept_gzip: bool = True) -> None:
+        self.statuses = list(statuses)
+        self.accept_gzip = accept_gzip
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if not self.accept_gzip and "content-encoding" in request.headers:
+            if request.headers["content-encoding"] != "identity":
+                return httpx.Response(415)
+        return httpx.Response(self.statuses.pop(0) if self.statuses else 200)
+
+    def bodies(self) -> list[tuple[str, bytes]]:
+        return [(request.url.path, request.content) for request in self.requests]
+
+
+def upload(backend: Backend, demand: dict = DEMAND):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(backend)) as http:
+            config = SimpleNamespace(backend_endpoint=ENDPOINT, token="token")
+            client = SimpleNamespace(config=config, http_client=http)
+            await ItemDemand(client).upload(demand)  # type: ignore
+
+    anyio.run(run)
+
+
+@pytest.fixture(autouse=True)
+def last_upload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    path = tmp_path / "last_upload.json"
+    monkeypatch.setattr(item_demand, "LAST_UPLOAD_PATH", path)
+    monkeypatch.setattr(item_demand.config, "upload_encoding", "identity")
+    monkeypatch.setattr(item_demand.config, "upload_delta", False)
+    monkeypatch.setattr(ItemDemand.post.retry, "wait", wait_none())
+    return path
+
+
+def test_skip_unchanged(last_upload: Path):
+    last_upload.write_bytes(dump_demand(DEMAND))
+    backend = Backend()
+
+    upload(backend)
+
+    assert backend.requests == []
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retry_transient(last_upload: Path, status: int):
+    backend = Backend(status, status)
+
+    upload(backend)
+
+    path = "/api/v1/item/demand"
+    assert backend.bodies() == [(path, dump_demand(DEMAND))] * 3
+    assert last_upload.read_bytes() == dump_demand(DEMAND)
+
+
+def test_no_retry_client_error(last_upload: Path):
+    backend = Backend(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        upload(backend)
+
+    assert len(backend.requests) == 1
+    assert not last_upload.exists()
+
+
+def test_delta(last_upload: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(item_demand.config, "upload_delta", True)
+    last = dump_demand({"old": {}, "item": {}})
+    last_upload.write_bytes(last)
+    backend = Backend()
+
+    upload(backend)
+
+    [(path, body)] = backend.bodies()
+    assert path == "/api/v1/item/demand/delta"
+    assert json.loads(body) == {
+        "base": hashlib.sha256(last).hexdigest(),
+        "changed": DEMAND,
+        "removed": ["old"],
+    }
+    assert last_upload.read_bytes() == dump_demand(DEMAND)
+
+
+@pytest.mark.parametrize("status", sorted(item_demand.DELTA_REJECTED))
+def test_delta_rejected(
+    last_upload: Path, monkeypatch: pytest.MonkeyPatch, status: int
+):
+    monkeypatch.setattr(item_demand.config, "upload_delta", True)
+    last_upload.write_bytes(dump_demand({}))
+    backend = Backend(status)
+
+    upload(backend)
+
+    paths = [path for path, _ in backend.bodies()]
+    assert paths == ["/api/v1/item/demand/delta", "/api/v1/item/demand"]
+    assert backend.requests[-1].content == dump_demand(DEMAND)
+    assert last_upload.read_bytes() == dump_demand(DEMAND)
+
+
+def test_compressed(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(item_demand.config, "upload_encoding", "gzip")
+    backend = Backend()
+
+    upload(backend)
+
+    [request] = backend.requests
+    assert request.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(request.content) == dump_demand(DEMAND)
+
+
+def test_compression_unsupported(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(item_demand.config, "upload_encoding", "gzip")
+    backend = Backend(accept_gzip=False)
+
+    upload(backend)
+
+    compressed, plain = backend.requests
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert plain.headers["content-encoding"] == "identity"
+    assert plain.content == dump_demand(DEMAND)
@@ -35,5 +35,30 @@ class Config(BaseSettings):
 
     sentry_dsn: str | None = None
 
+    dependency_cache_size: int = 1 << 30
+    bundle_cache_size: int = 0
+    decompress_workers: int | None = None
+    texture_cache_size: int = 512 << 20
+    image_cache_size: int = 128 << 20
+
+    image_formats: list[Literal["png", "webp"]] = ["png"]
+    png_compress_level: int = 6
+    fast_encode: bool = False
+    encode_workers: int | None = None
+    process_workers: int | None = None
+    thumbnail_sizes: list[int] = []
+    dedup_outputs: bool = False
+
+    audio_workers: int | None = None
+    keep_wav: bool = True
+
+    # compressed bodies need a backend that accepts them; zstd needs the zstd
+    # extra (the zstandard package) and falls back to gzip without it
+    upload_encoding: Literal["identity", "gzip", "zstd"] = "identity"
+    upload_delta: bool = False
+
+    gamedata_sqlite: bool = False
+    gamedata_store: bool = False
+
     def is_production(self):
         return self.environment == "production"
@@ -15,7 +15,15 @@ ASSETS_DIR = BASE_DIR / "assets"
 
 STORAGE_DIR = BASE_DIR / "storage"
 GAMEDATA_DIR = STORAGE_DIR / "asset" / "gamedata"
+GAMEDATA_STORE_DIR = STORAGE_DIR / "gamedata_store"
+GAMEDATA_SQLITE_DIR = STORAGE_DIR / "gamedata_sqlite"
+RAW_ASSET_DIR = STORAGE_DIR / "asset" / "raw"
+THUMBNAIL_DIR = STORAGE_DIR / "asset" / "thumbnail"
 HOT_UPDATE_LIST_DIR = STORAGE_DIR / "hot_update_list"
+BUNDLE_INDEX_DIR = STORAGE_DIR / "bundle_index"
+BUNDLE_CACHE_DIR = STORAGE_DIR / "bundle_cache"
+OUTPUT_STORE_DIR = STORAGE_DIR / "output_store"
+REPORT_DIR = STORAGE_DIR / "report"
 
 HEADERS = {
     "user-agent": "Dalvik/2.1.0 (Linux; U; Android 6.0.1; vivo X9L Build/MMB29M)"
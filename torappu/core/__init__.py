@@ -13,6 +13,7 @@ from torappu.models import Diff, Version
 
 from .client import Client
 from .task import Task, registry
+from .texture import texture_cache
 
 # 2.5.04 25-04-03-14-16-11_4f0a01
 DECOMPRESSION_MAP[CompressionFlags.LZHAM] = lz4inv.decompress_buffer
@@ -75,3 +76,5 @@ async def main(
                     continue
 
                 tg.start_soon(check_and_run_task, task(client), diff)
+
+    texture_cache.report()
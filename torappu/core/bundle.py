@@ -0,0 +1,382 @@
+import mmap
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, nullcontext
+from threading import RLock
+
+from UnityPy import Environment
+from UnityPy.enums import ArchiveFlags, ArchiveFlagsOld, CompressionFlags
+from UnityPy.environment import simplify_name
+from UnityPy.files import BundleFile, File, SerializedFile
+from UnityPy.files.BundleFile import BlockInfo, DirectoryInfoFS
+from UnityPy.files.ObjectReader import ObjectReader
+from UnityPy.helpers.ArchiveStorageManager import ArchiveStorageDecryptor
+from UnityPy.streams import EndianBinaryReader
+
+from torappu import get_config
+from torappu.consts import BUNDLE_CACHE_DIR
+from torappu.core.utils import write_atomic
+from torappu.log import logger
+
+config = get_config()
+
+# not measured on a multi-core machine yet, see scripts/bench_decompress.py
+PARALLEL_DECOMPRESS_SIZE = 8 << 20
+# lz4 releases the GIL while decompressing; lz4inv (LZHAM) holds it throughout
+PARALLEL_COMPRESSION = {CompressionFlags.LZ4, CompressionFlags.LZ4HC}
+
+decompress_executor = ThreadPoolExecutor(
+    config.decompress_workers, thread_name_prefix="decompress"
+)
+
+
+def file_size(file: File, path: str) -> int:
+    """Size of the decompressed data held by a parsed bundle"""
+    size = 0
+    for f in file.files.values():
+        if isinstance(f, SerializedFile):
+            size += f.reader.Length
+        elif isinstance(f, EndianBinaryReader):
+            size += f.Length
+
+    return size or os.path.getsize(path)
+
+
+class SharedObjectReader(ObjectReader):
+    """Reader of an object in a cached dependency, used by every task.
+
+    The objects of a serialized file, and the resources of its bundle, are
+    read through readers whose single position every read moves, so each
+    read holds the lock of the bundle.
+    """
+
+    lock: RLock
+
+    def read(self, check_read: bool = True):
+        with self.lock:
+            return super().read(check_read)
+
+    def read_typetree(self, *args, **kwargs):
+        with self.lock:
+            return super().read_typetree(*args, **kwargs)
+
+    def get_raw_data(self) -> bytes:
+        with self.lock:
+            return super().get_raw_data()
+
+
+def reader_lock(obj: ObjectReader) -> AbstractContextManager:
+    """Lock to hold while moving the reader of `obj` by other means"""
+    return obj.lock if isinstance(obj, SharedObjectReader) else nullcontext()
+
+
+def share_objects(bundle: File):
+    """Make the objects of the dependency `bundle` safe to read from any thread"""
+    lock = RLock()
+    files = [bundle] if isinstance(bundle, SerializedFile) else bundle.files.values()
+    for f in files:
+        if isinstance(f, SerializedFile):
+            for obj in f.objects.values():
+                obj.__class__ = SharedObjectReader
+                obj.lock = lock  # type: ignore
+
+
+class DependencyEnvironment(Environment):
+    """Environment owning the dependency bundles shared by every task.
+
+    Pointers between two dependencies are resolved against this environment,
+    so a bundle evicted from the cache is parsed again on demand.
+    """
+
+    def __init__(self, cache: "DependencyCache") -> None:
+        super().__init__()
+        self.cache = cache
+
+    def find_file(self, name: str, is_dependency: bool = True):
+        if (cab := self.get_cab(name)) is not None:
+            return cab
+
+        path = self.cache.cab_to_path.get(simplify_name(name))
+        if path is None:
+            return None
+
+        self.cache.get(path)
+        return self.get_cab(name)
+
+
+class DependencyCache:
+    """Process-wide LRU cache of parsed dependency bundles (`anon/`, `refs/`)."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.env = DependencyEnvironment(self)
+        self.bundles: OrderedDict[str, tuple[File, int]] = OrderedDict()
+        self.cab_to_path: dict[str, str] = {}
+        self.lock = RLock()
+
+    def get(self, path: str) -> File:
+        with self.lock:
+            if path in self.bundles:
+                self.bundles.move_to_end(path)
+                return self.bundles[path][0]
+
+            bundle = open_bundle(path, self.env, is_dependency=True)
+            share_objects(bundle)
+
+            size = file_size(bundle, path)
+            for name in bundle.files:
+                self.cab_to_path[simplify_name(name)] = path
+            self.bundles[path] = (bundle, size)
+            self.size += size
+            self.evict()
+
+            return bundle
+
+    def evict(self):
+        # the most recently used bundle always stays, even if it is over budget
+        while self.size > self.max_size and len(self.bundles) > 1:
+            path, (bundle, size) = self.bundles.popitem(last=False)
+            self.size -= size
+            self.env.files.pop(path, None)
+            for name in bundle.files:
+                self.env.cabs.pop(simplify_name(name), None)
+            logger.debug(f"Evicted dependency {path} ({size} bytes)")
+
+    def attach(self, env: Environment, path: str):
+        """Make the cached dependency at `path` resolvable from `env`"""
+        bundle = self.get(path)
+        env.files[path] = bundle
+        for name, f in bundle.files.items():
+            if isinstance(f, SerializedFile | EndianBinaryReader):
+                env.register_cab(name, f)
+
+
+def open_cached_blocks(name: str, size: int) -> mmap.mmap | None:
+    """Map the cached decompressed data of bundle `name`, if it is cached"""
+    path = BUNDLE_CACHE_DIR / name
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size != size:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+    # the modification time orders entries for eviction
+    os.utime(path)
+    return data
+
+
+def store_cached_blocks(name: str, data: mmap.mmap):
+    write_atomic(BUNDLE_CACHE_DIR / name, data)
+
+    evict_cached_blocks()
+
+
+def evict_cached_blocks():
+    """Remove least recently used entries until the cache fits its budget"""
+    entries = []
+    for entry in BUNDLE_CACHE_DIR.iterdir():
+        if entry.name.startswith("."):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    entries.sort()
+
+    size = sum(entry_size for _, entry_size, _ in entries)
+    for _, entry_size, entry in entries:
+        if size <= config.bundle_cache_size:
+            break
+        try:
+            entry.unlink()
+        except OSError:
+            continue
+        size -= entry_size
+        logger.debug(f"Evicted cached blocks of {entry.name}")
+
+
+dependency_cache = DependencyCache(config.dependency_cache_size)
+
+
+class MappedBundleFile(BundleFile):
+    """UnityFS bundle whose blocks are decompressed into a memory map.
+
+    The serialized files inside are readers over slices of the map, so only
+    object headers are parsed up front and object data is not copied until
+    the object is read.
+    """
+
+    mapped: mmap.mmap
+
+    def read_blocks_info(
+        self, reader: EndianBinaryReader
+    ) -> tuple[list[BlockInfo], list[DirectoryInfoFS], int]:
+        # mirrors BundleFile.read_fs up to the point where blocks are read
+        reader.read_long()
+        compressed_size = reader.read_u_int()
+        uncompressed_size = reader.read_u_int()
+        dataflags_value = reader.read_u_int()
+
+        version = self.get_version_tuple()
+        if (
+            version < (2020,)
+            or (version[0] == 2020 and version < (2020, 3, 34))
+            or (version[0] == 2021 and version < (2021, 3, 2))
+            or (version[0] == 2022 and version < (2022, 1, 1))
+        ):
+            self.dataflags = ArchiveFlagsOld(dataflags_value)
+        else:
+            self.dataflags = ArchiveFlags(dataflags_value)
+
+        if self.dataflags & self.dataflags.UsesAssetBundleEncryption:
+            self.decryptor = ArchiveStorageDecryptor(reader)
+
+        if self.version >= 7:
+            reader.align_stream(16)
+            self._uses_block_alignment = True
+        elif version >= (2019, 4):
+            pre_align = reader.Position
+            align_data = reader.read((16 - pre_align % 16) % 16)
+            if any(align_data):
+                reader.Position = pre_align
+            else:
+                self._uses_block_alignment = True
+
+        start = reader.Position
+        if self.dataflags & ArchiveFlags.BlocksInfoAtTheEnd:
+            reader.Position = reader.Length - compressed_size
+            blocks_info_bytes = reader.read_bytes(compressed_size)
+            reader.Position = start
+        else:
+            blocks_info_bytes = reader.read_bytes(compressed_size)
+
+        blocks_info_reader = EndianBinaryReader(
+            self.decompress_data(blocks_info_bytes, uncompressed_size, self.dataflags),
+            offset=start,
+        )
+        blocks_info_reader.read_bytes(16)
+        blocks = [
+            BlockInfo(
+                blocks_info_reader.read_u_int(),
+                blocks_info_reader.read_u_int(),
+                blocks_info_reader.read_u_short(),
+            )
+            for _ in range(blocks_info_reader.read_int())
+        ]
+        directory = [
+            DirectoryInfoFS(
+                blocks_info_reader.read_long(),
+                blocks_info_reader.read_long(),
+                blocks_info_reader.read_u_int(),
+                blocks_info_reader.read_string_to_null(),
+            )
+            for _ in range(blocks_info_reader.read_int())
+        ]
+
+        if blocks:
+            self._block_info_flags = blocks[0].flags
+
+        if (
+            isinstance(self.dataflags, ArchiveFlags)
+            and self.dataflags & ArchiveFlags.BlockInfoNeedPaddingAtStart
+        ):
+            reader.align_stream(16)
+
+        return blocks, directory, blocks_info_reader.real_offset()
+
+    def read_fs(self, reader: EndianBinaryReader):
+        blocks, directory, offset = self.read_blocks_info(reader)
+        size = sum(block.uncompressedSize for block in blocks)
+
+        use_cache = config.bundle_cache_size > 0 and size > 0
+        if use_cache and (cached := open_cached_blocks(self.name, size)):
+            self.mapped = cached
+        else:
+            self.mapped = self.decompress_blocks(reader, blocks, size)
+            if use_cache:
+                store_cached_blocks(self.name, self.mapped)
+
+        return directory, EndianBinaryReader(memoryview(self.mapped), offset=offset)
+
+    def decompress_blocks(
+        self, reader: EndianBinaryReader, blocks: list[BlockInfo], size: int
+    ) -> mmap.mmap:
+        """Decompress `blocks` into a new anonymous map.
+
+        Blocks are independent, so large LZ4 bundles are split into contiguous
+        runs of blocks that are decompressed on `decompress_executor`.
+        """
+        mapped = mmap.mmap(-1, max(size, 1))
+        view = reader.bytes
+
+        jobs: list[tuple[int, BlockInfo, int, int]] = []
+        source, position = reader.Position, 0
+        for i, block in enumerate(blocks):
+            jobs.append((i, block, source, position))
+            source += block.compressedSize
+            position += block.uncompressedSize
+        reader.Position = source
+
+        def decompress(run: list[tuple[int, BlockInfo, int, int]]):
+            for i, block, source, position in run:
+                mapped[position : position + block.uncompressedSize] = (
+                    self.decompress_data(
+                        view[source : source + block.compressedSize],
+                        block.uncompressedSize,
+                        block.flags,
+                        i,
+                    )
+                )
+
+        workers = config.decompress_workers or os.cpu_count() or 1
+        if (
+            workers == 1
+            or len(jobs) < 2
+            or size < PARALLEL_DECOMPRESS_SIZE
+            or not all(
+                CompressionFlags(block.flags & ArchiveFlags.CompressionTypeMask)
+                in PARALLEL_COMPRESSION
+                for block in blocks
+            )
+        ):
+            decompress(jobs)
+        else:
+            # a few runs per worker keeps them busy when block ratios differ
+            step = -(-len(jobs) // (workers * 4))
+            runs = [jobs[i : i + step] for i in range(0, len(jobs), step)]
+            list(decompress_executor.map(decompress, runs))
+
+        return mapped
+
+
+def open_bundle(path: str, env: Environment, is_dependency: bool = False) -> File:
+    """Parse the bundle at `path` into `env`, through `MappedBundleFile` if possible"""
+    with open(path, "rb") as f:
+        if f.read(8) != b"UnityFS\x00":
+            file = env.load_file(path, is_dependency=is_dependency)
+            if file is None:
+                raise FileNotFoundError(path)
+            return file
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    env.files[path] = MappedBundleFile(
+        EndianBinaryReader(memoryview(data)),
+        env,
+        name=path,
+        is_dependency=is_dependency,
+    )
+    return env.files[path]
+
+
+def load_bundle(path: str) -> Environment:
+    """Load the bundle at `path` like `UnityPy.load`, through `MappedBundleFile`"""
+    env = Environment()
+    env.path = os.path.dirname(path)
+    env.file = open_bundle(path, env)
+
+    return env
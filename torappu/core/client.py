@@ -8,7 +8,6 @@ from tempfile import TemporaryDirectory
 from zipfile import ZipFile
 
 import httpx
-import UnityPy
 from tenacity import retry, wait_random_exponential
 from UnityPy.classes import MonoBehaviour
 
@@ -20,6 +19,7 @@ from torappu.consts import (
     HOT_UPDATE_LIST_DIR,
     STORAGE_DIR,
 )
+from torappu.core.bundle import load_bundle
 from torappu.log import logger
 from torappu.models import ABInfo, Diff, HotUpdateInfo, Version
 
@@ -44,6 +44,8 @@ class Client:
         self.http_client = httpx.AsyncClient(timeout=config.timeout)
         self.asset_to_bundle: dict[str, str] = {}
         self.downloaded: dict[str, Path] = {}
+        self.prefix_resolved: dict[str, list[str]] = {}
+        self.prefix_lock = asyncio.Lock()
 
     async def init(self):
         self.hot_update_list = await self.load_hot_update_list(self.version.res_version)
@@ -180,16 +182,23 @@ class Client:
         return list(zip(path, result))
 
     async def resolve_by_prefix(self, prefix: str) -> list[str]:
-        paths = {
-            info.name
-            for info in self.hot_update_list.ab_infos
-            if info.name.startswith(prefix)
-        }
+        async with self.prefix_lock:
+            if prefix in self.prefix_resolved:
+                return self.prefix_resolved[prefix]
 
-        if len(paths) == 0:
-            return []
+            paths = {
+                info.name
+                for info in self.hot_update_list.ab_infos
+                if info.name.startswith(prefix)
+            }
+            result = (
+                list(await asyncio.gather(*(self.resolve(p) for p in paths)))
+                if paths
+                else []
+            )
+            self.prefix_resolved[prefix] = result
 
-        return await asyncio.gather(*(self.resolve(p) for p in paths))
+            return result
 
     # [["abpath", "real_path"]]
     async def resolve_abs(self, path: list[str]) -> list[tuple[str, str]]:
@@ -198,7 +207,7 @@ class Client:
 
     async def load_torappu_index(self):
         path = await self.resolve_ab("torappu_index")
-        env = UnityPy.load(path)
+        env = load_bundle(path)
 
         torappu_index = env.container["dyn/torappu_index.asset"].read()
 
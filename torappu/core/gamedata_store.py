@@ -0,0 +1,131 @@
+"""Compressed gamedata versions, deduplicated across versions.
+
+A stored version is a manifest, `versions/<res_version>.json`, mapping the
+path of each of its files to the SHA-256 of their content. Each content is
+stored once under `blobs/`, compressed with zstd, or with gzip when the
+zstandard package (the `zstd` extra) is not installed.
+
+The plain tree of the latest version is kept for `gamedata/latest`, and
+`prune` removes the plain trees of the versions stored before it.
+"""
+
+import gzip
+import hashlib
+import json
+import shutil
+from collections.abc import Callable
+from functools import cache, lru_cache
+from pathlib import Path
+
+from torappu.consts import GAMEDATA_DIR, GAMEDATA_STORE_DIR
+from torappu.core.utils import write_atomic
+from torappu.log import logger
+
+BLOB_DIR = GAMEDATA_STORE_DIR / "blobs"
+VERSION_DIR = GAMEDATA_STORE_DIR / "versions"
+# name of the last version stored
+LATEST_PATH = GAMEDATA_STORE_DIR / "latest"
+
+ZSTD_LEVEL = 10
+
+
+@cache
+def compressor() -> tuple[str, Callable[[bytes], bytes]]:
+    try:
+        import zstandard
+    except ImportError:
+        logger.warning("zstandard is not installed, storing gamedata with gzip")
+        return ".gz", gzip.compress
+
+    return ".zst", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+
+
+def decompress(path: Path) -> bytes:
+    data = path.read_bytes()
+    if path.suffix == ".gz":
+        return gzip.decompress(data)
+
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def blob_path(digest: str) -> Path | None:
+    for suffix in (".zst", ".gz"):
+        path = BLOB_DIR / digest[:2] / f"{digest}{suffix}"
+        if path.is_file():
+            return path
+    return None
+
+
+def store_blob(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    if blob_path(digest) is None:
+        suffix, compress = compressor()
+        write_atomic(BLOB_DIR / digest[:2] / f"{digest}{suffix}", compress(data))
+    return digest
+
+
+@lru_cache
+def manifest(res_version: str) -> dict[str, str] | None:
+    path = VERSION_DIR / f"{res_version}.json"
+    return json.loads(path.read_text("utf-8")) if path.is_file() else None
+
+
+def ingest(res_version: str, remove: bool = True) -> dict[str, str]:
+    """Store the plain tree of `res_version` and, with `remove`, delete it"""
+    source = GAMEDATA_DIR / res_version
+    files = {
+        path.relative_to(source).as_posix(): store_blob(path.read_bytes())
+        for path in sorted(source.rglob("*"))
+        if path.is_file() and not path.is_symlink()
+    }
+    write_atomic(
+        VERSION_DIR / f"{res_version}.json",
+        json.dumps(files, indent=1).encode(),
+    )
+    write_atomic(LATEST_PATH, res_version.encode())
+    manifest.cache_clear()
+
+    if remove:
+        shutil.rmtree(source)
+    logger.info(f"Stored {len(files)} gamedata files of {res_version}")
+    return files
+
+
+def prune(keep: str):
+    """Delete the plain trees of stored versions other than `keep`"""
+    for source in GAMEDATA_DIR.iterdir():
+        if (
+            source.name != keep
+            and source.is_dir()
+            and not source.is_symlink()
+            and (VERSION_DIR / f"{source.name}.json").is_file()
+        ):
+            shutil.rmtree(source)
+            logger.info(f"Removed the plain gamedata of {source.name}, it is stored")
+
+
+def read(res_version: str, path: str) -> bytes:
+    """Content of the gamedata file `path`, from the plain tree or the store"""
+    plain = GAMEDATA_DIR / res_version / path
+    if plain.is_file():
+        return plain.read_bytes()
+
+    files = manifest(res_version)
+    if files is None or path not in files:
+        raise FileNotFoundError(plain)
+    blob = blob_path(files[path])
+    if blob is None:
+        raise FileNotFoundError(f"missing blob {files[path]} of {plain}")
+    return decompress(blob)
+
+
+def export(res_version: str, dest: Path):
+    """Write the stored files of `res_version` as a plain tree under `dest`"""
+    files = manifest(res_version)
+    if files is None:
+        raise FileNotFoundError(f"gamedata {res_version} is not stored")
+
+    for path in files:
+        write_atomic(dest / path, read(res_version, path))
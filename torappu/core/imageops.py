@@ -0,0 +1,87 @@
+"""Integer image kernels over uint8 NumPy arrays of shape (height, width, bands).
+
+Products of two 8-bit values are kept in uint16 and divided by 255 with
+shifts, and large images are processed in stripes of rows, so the scratch
+memory of a kernel stays small no matter the size of the texture.
+"""
+
+import numpy as np
+
+STRIPE_ROWS = 256
+
+
+def div255(x: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """Divide uint16 `x` (at most 255 * 255) by 255 in place, rounding down"""
+    # exact for 0 <= x <= 65535: x // 255 == (x + 1 + (x >> 8)) >> 8
+    np.right_shift(x, 8, out=scratch)
+    x += scratch
+    x += 1
+    x >>= 8
+    return x
+
+
+def premultiply(data: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """Multiply the RGB channels of RGBA `data` by its alpha channel.
+
+    Writes into `out`, which defaults to `data` itself.
+    """
+    if out is None:
+        out = data
+    elif out is not data:
+        out[..., 3] = data[..., 3]
+
+    height, width = data.shape[:2]
+    rows = min(STRIPE_ROWS, height)
+    product = np.empty((rows, width, 3), np.uint16)
+    scratch = np.empty_like(product)
+    for top in range(0, height, rows):
+        bottom = min(top + rows, height)
+        stripe = product[: bottom - top]
+        np.multiply(
+            data[top:bottom, :, :3],
+            data[top:bottom, :, 3:],
+            out=stripe,
+            dtype=np.uint16,
+        )
+        out[top:bottom, :, :3] = div255(stripe, scratch[: bottom - top])
+
+    return out
+
+
+def crop(
+    data: np.ndarray,
+    box: tuple[int, int, int, int],
+    rotate: bool = False,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """Cut the (left, upper, right, lower) `box` out of `data`.
+
+    `rotate` turns the result 90 degrees clockwise, like PIL's
+    `rotate(-90, expand=True)`. Without `out`, an unrotated result is a view
+    of `data`; a rotated one is copied into a new array.
+    """
+    left, upper, right, lower = box
+    view = data[upper:lower, left:right]
+    if not rotate:
+        if out is None:
+            return view
+        out[...] = view
+        return out
+
+    if out is None:
+        out = np.empty((view.shape[1], view.shape[0], *view.shape[2:]), data.dtype)
+
+    if (
+        data.dtype == np.uint8
+        and data.ndim == 3
+        and data.shape[2] == 4
+        and data.flags.c_contiguous
+        and out.flags.c_contiguous
+    ):
+        # transpose whole RGBA pixels rather than single bytes
+        pixels = data.view(np.uint32)[..., 0][upper:lower, left:right]
+        out.view(np.uint32)[..., 0] = np.rot90(pixels, k=-1)
+    else:
+        out[...] = np.rot90(view, k=-1)
+
+    return out
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import shutil
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import BoundedSemaphore, Lock, get_ident
+from typing import Any
+
+from anyio import to_thread
+from PIL import Image
+
+from torappu import get_config
+from torappu.consts import OUTPUT_STORE_DIR, RAW_ASSET_DIR, THUMBNAIL_DIR
+from torappu.log import logger
+
+config = get_config()
+
+encode_workers = config.encode_workers or os.cpu_count() or 1
+encode_executor = ThreadPoolExecutor(encode_workers, thread_name_prefix="encode")
+
+# bounds the decoded images held in memory while waiting for a worker
+pending_slots = BoundedSemaphore(encode_workers * 4)
+
+
+class EncodeError(Exception):
+    def __init__(self, paths: list[Path]) -> None:
+        names = ", ".join(map(str, paths[:3]))
+        more = f" and {len(paths) - 3} more" if len(paths) > 3 else ""
+        super().__init__(f"Failed to write {names}{more}")
+        self.paths = paths
+
+    def __reduce__(self):
+        # raised in worker processes too
+        return type(self), (self.paths,)
+
+
+class EncodeBatch:
+    """Images queued within one `encode_batch`, e.g. by one task"""
+
+    def __init__(self) -> None:
+        self.pending: set[Future[None]] = set()
+        # images whose encoding failed, until `flush` reports them
+        self.failed: list[Path] = []
+        self.lock = Lock()
+
+    def flush(self):
+        """Block until every image of the batch queued so far is written.
+
+        Raises `EncodeError` naming the images that failed since the last call.
+        """
+        with self.lock:
+            futures = list(self.pending)
+        if futures:
+            wait(futures)
+
+        with self.lock:
+            paths = self.failed.copy()
+            self.failed.clear()
+        if paths:
+            raise EncodeError(paths)
+
+
+current_batch: ContextVar[EncodeBatch] = ContextVar(
+    "current_batch", default=EncodeBatch()
+)
+
+
+@contextmanager
+def encode_batch() -> Iterator[EncodeBatch]:
+    """Collect the images queued in this context apart from any other.
+
+    Tasks and worker threads started within inherit the batch, so a task
+    waits for, and reports the failures of, its own images only.
+    """
+    token = current_batch.set(batch := EncodeBatch())
+    try:
+        yield batch
+    finally:
+        current_batch.reset(token)
+
+
+def encode_options(image_format: str) -> dict[str, Any]:
+    if image_format == "webp":
+        # exact keeps the colour of fully transparent pixels, like PNG does
+        return {
+            "lossless": True,
+            "exact": True,
+            "method": 0 if config.fast_encode else 4,
+        }
+
+    return {"compress_level": 1 if config.fast_encode else config.png_compress_level}
+
+
+def write_image(image: Image.Image, path: Path, image_format: str):
+    # never write through a hard link into the output store
+    if path.is_file() and path.stat().st_nlink > 1:
+        path.unlink()
+    image.save(path, format=image_format.upper(), **encode_options(image_format))
+
+
+def pixel_key(image: Image.Image) -> str:
+    """Hash of the mode, size and raw pixels of `image`"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.mode} {image.width}x{image.height}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def blob_path(key: str, image_format: str) -> Path:
+    """Path in `OUTPUT_STORE_DIR` of pixels `key` encoded as `image_format`"""
+    options = repr(sorted(encode_options(image_format).items())).encode()
+    settings = hashlib.blake2b(options, digest_size=4).hexdigest()
+    return OUTPUT_STORE_DIR / key[:2] / f"{key}-{settings}.{image_format}"
+
+
+def link_output(blob: Path, path: Path):
+    path.unlink(missing_ok=True)
+    try:
+        os.link(blob, path)
+    except OSError:
+        # e.g. the store is on another file system
+        shutil.copyfile(blob, path)
+
+
+def encode_image(image: Image.Image, path: Path, thumbnails: bool = False):
+    """Write `image` to `path` in every format of `config.image_formats`.
+
+    The suffix of `path` is replaced by the one of each format. With
+    `thumbnails`, `encode_thumbnails` follows from the image in memory.
+
+    With `config.dedup_outputs`, each encoding is stored once under
+    `OUTPUT_STORE_DIR`, named by the hash of the raw pixels, and hard linked
+    to `path`; pixels already in the store are not encoded again.
+    """
+    key = pixel_key(image) if config.dedup_outputs else None
+    for image_format in config.image_formats:
+        dest = path.with_suffix(f".{image_format}")
+        if key is None:
+            write_image(image, dest, image_format)
+            continue
+
+        blob = blob_path(key, image_format)
+        if not blob.is_file():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = blob.with_name(f".{get_ident()}.{blob.name}")
+            image.save(
+                temp_path,
+                format=image_format.upper(),
+                **encode_options(image_format),
+            )
+            os.replace(temp_path, blob)
+        link_output(blob, dest)
+
+    if thumbnails:
+        encode_thumbnails(image, path)
+
+
+def encode_thumbnails(image: Image.Image, path: Path):
+    """Write downscaled copies of `image` for `config.thumbnail_sizes`.
+
+    A thumbnail fits in a square of its size and mirrors `path` under
+    `THUMBNAIL_DIR / size`. Each is reduced from `image` itself; sizes not
+    smaller than the image, and images outside `RAW_ASSET_DIR`, are skipped.
+    """
+    if not path.is_relative_to(RAW_ASSET_DIR):
+        logger.warning(f"No thumbnails for {path}, outside {RAW_ASSET_DIR}")
+        return
+
+    relative = path.relative_to(RAW_ASSET_DIR)
+    for size in config.thumbnail_sizes:
+        if max(image.size) <= size:
+            continue
+
+        scale = size / max(image.size)
+        thumbnail = image.resize(
+            (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+            Image.Resampling.LANCZOS,
+            reducing_gap=3.0,
+        )
+        thumbnail_path = THUMBNAIL_DIR / str(size) / relative
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+        encode_image(thumbnail, thumbnail_path)
+
+
+def submit_image(image: Image.Image, path: Path, thumbnails: bool) -> Future[None]:
+    """Queue `image` once the caller holds one of `pending_slots`"""
+    batch = current_batch.get()
+    future = encode_executor.submit(encode_image, image, path, thumbnails)
+    with batch.lock:
+        batch.pending.add(future)
+
+    def done(future: Future[None]):
+        pending_slots.release()
+        with batch.lock:
+            batch.pending.discard(future)
+            if (e := future.exception()) is not None:
+                batch.failed.append(path)
+        if e is not None:
+            logger.opt(exception=e).error(f"Failed to write {path}")
+
+    future.add_done_callback(done)
+    return future
+
+
+def save_image(
+    image: Image.Image, path: Path, thumbnails: bool = False
+) -> Future[None]:
+    """Queue `image` to be written to `path` on `encode_executor`.
+
+    Blocks only when too many images are already waiting, so coroutines use
+    `save_image_async` instead. The image must not be modified afterwards;
+    `wait_encoded` waits until it is on disk.
+    """
+    pending_slots.acquire()
+    return submit_image(image, path, thumbnails)
+
+
+async def save_image_async(
+    image: Image.Image, path: Path, thumbnails: bool = False
+) -> Future[None]:
+    """`save_image` that waits for a free slot without blocking the event loop"""
+    if not pending_slots.acquire(blocking=False):
+        acquired = False
+
+        def acquire():
+            nonlocal acquired
+            pending_slots.acquire()
+            acquired = True
+
+        try:
+            await to_thread.run_sync(acquire)
+        except BaseException:
+            # cancelled, possibly after the thread took the slot
+            if acquired:
+                pending_slots.release()
+            raise
+    return submit_image(image, path, thumbnails)
+
+
+def flush_encoded():
+    """Block until every image queued in the current `encode_batch` is written.
+
+    Raises `EncodeError` naming the images of the batch that failed since the
+    last call.
+    """
+    current_batch.get().flush()
+
+
+async def wait_encoded():
+    """Wait for the images of the current `encode_batch`, see `flush_encoded`"""
+    await to_thread.run_sync(current_batch.get().flush)
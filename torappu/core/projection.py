@@ -0,0 +1,216 @@
+"""Parse only selected fields out of large JSON documents.
+
+Fields are given as dotted paths: `*` stands for every value of an object
+and a `[]` suffix for every item of an array, e.g. `items.*.iconId` or
+`medalList[].medalId`. Missing fields are left out instead of raising.
+
+The document is never parsed as a whole. A structural index of its brackets,
+colons and commas outside strings is built with NumPy, a chunk at a time, in
+the manner of the first stage of simdjson. Objects are walked through it down
+to the first `*` or `[]`, and each record there is parsed on its own by a
+pydantic-core schema that only builds the selected fields. Unselected
+values in between are skipped without being parsed.
+"""
+
+import json
+from functools import lru_cache
+from itertools import pairwise
+from typing import Any
+
+import numpy as np
+from pydantic_core import SchemaValidator, core_schema
+
+Tree = dict[str, "Tree"]
+
+CHUNK_SIZE = 1 << 20
+
+STRUCTURAL = np.zeros(256, np.bool_)
+STRUCTURAL[list(b"{}[],:")] = True
+DEPTH_DELTA = np.zeros(256, np.int8)
+DEPTH_DELTA[list(b"{[")] = 1
+DEPTH_DELTA[list(b"}]")] = -1
+WHITESPACE = b" \t\n\r"
+
+
+def field_tree(fields: tuple[str, ...]) -> Tree:
+    tree: Tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            name, is_array = (part[:-2], True) if part.endswith("[]") else (part, False)
+            if name:
+                node = node.setdefault(name, {})
+            if is_array:
+                node = node.setdefault("[]", {})
+
+    return tree
+
+
+def is_wildcard(tree: Tree) -> bool:
+    if "*" in tree or "[]" in tree:
+        if len(tree) > 1:
+            raise ValueError(f"Conflicting fields at {', '.join(tree)}")
+        return True
+    return False
+
+
+def tree_schema(tree: Tree) -> core_schema.CoreSchema:
+    if not tree:
+        return core_schema.any_schema()
+
+    if is_wildcard(tree):
+        if "*" in tree:
+            schema = core_schema.dict_schema(
+                core_schema.str_schema(), tree_schema(tree["*"])
+            )
+        else:
+            schema = core_schema.list_schema(tree_schema(tree["[]"]))
+    else:
+        schema = core_schema.typed_dict_schema(
+            {
+                name: core_schema.typed_dict_field(tree_schema(node), required=False)
+                for name, node in tree.items()
+            }
+        )
+
+    # containers in gamedata are often null instead of empty
+    return core_schema.nullable_schema(schema)
+
+
+def index_depth(tree: Tree) -> int:
+    """Nesting depth the structural index must reach to walk `tree`"""
+    if not tree or is_wildcard(tree):
+        return 1 if tree else 0
+    return 1 + max(index_depth(node) for node in tree.values())
+
+
+class Plan:
+    """The fields of a projection, with the validators of its parts"""
+
+    def __init__(self, tree: Tree):
+        self.tree = tree
+        self.depth = index_depth(tree)
+        self.validators: dict[int, SchemaValidator] = {}
+
+    def validator(self, tree: Tree) -> SchemaValidator:
+        # subtrees live as long as the plan, so their ids are stable
+        if id(tree) not in self.validators:
+            self.validators[id(tree)] = SchemaValidator(tree_schema(tree))
+        return self.validators[id(tree)]
+
+
+@lru_cache
+def plan(fields: tuple[str, ...]) -> Plan:
+    return Plan(field_tree(fields))
+
+
+def structural_index(
+    data: bytes, max_depth: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Offsets, depths and bytes of the structure of `data` outside strings.
+
+    The depth of a byte counts the containers open right after it, and only
+    bytes at most `max_depth` deep are kept.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    offsets: list[np.ndarray] = []
+    depths: list[np.ndarray] = []
+    in_string = 0
+    depth = 0
+    for start in range(0, len(buf), CHUNK_SIZE):
+        chunk = buf[start : start + CHUNK_SIZE]
+
+        quotes = np.flatnonzero(chunk == ord('"')) + start
+        escaped = quotes[(quotes > 0) & (buf[quotes - 1] == ord("\\"))]
+        if len(escaped):
+            # a quote is escaped by an odd run of backslashes
+            dropped = []
+            for quote in escaped.tolist():
+                run = quote
+                while run > 0 and data[run - 1] == ord("\\"):
+                    run -= 1
+                if (quote - run) % 2:
+                    dropped.append(quote)
+            quotes = np.setdiff1d(quotes, dropped, assume_unique=True)
+
+        candidates = np.flatnonzero(STRUCTURAL[chunk]) + start
+        outside = (np.searchsorted(quotes, candidates) + in_string) % 2 == 0
+        candidates = candidates[outside]
+        in_string = (in_string + len(quotes)) % 2
+
+        levels = np.cumsum(DEPTH_DELTA[buf[candidates]], dtype=np.int32) + depth
+        if len(levels):
+            depth = int(levels[-1])
+        keep = levels <= max_depth
+        offsets.append(candidates[keep])
+        depths.append(levels[keep])
+
+    offset = np.concatenate(offsets) if offsets else np.empty(0, np.intp)
+    return offset, np.concatenate(depths) if depths else offset, buf[offset]
+
+
+class Document:
+    def __init__(self, data: bytes, plan: Plan):
+        self.data = data
+        self.plan = plan
+        self.offsets, self.depths, self.bytes = structural_index(data, plan.depth)
+
+    def start_of(self, a: int, b: int) -> int:
+        """Offset of the first byte of the value in `data[a:b]`"""
+        while a < b and self.data[a] in WHITESPACE:
+            a += 1
+        return a
+
+    def entries(self, a: int, b: int) -> list[tuple[bytes | None, int, int]]:
+        """(key, start, end) of the members of the container at `data[a:b]`"""
+        start = self.start_of(a, b)
+        i = int(np.searchsorted(self.offsets, start))
+        depth = self.depths[i]
+        inner = slice(i + 1, int(np.searchsorted(self.offsets, b)))
+        seps = self.offsets[inner][
+            (self.depths[inner] == depth) & np.isin(self.bytes[inner], [44, 58])
+        ].tolist()
+        end = int(self.offsets[inner.stop - 1])
+
+        bounds = [start, *seps, end]
+        if self.data[start] == ord("["):
+            if len(bounds) == 2 and self.start_of(start + 1, end) == end:
+                return []
+            return [(None, x + 1, y) for x, y in pairwise(bounds)]
+
+        # key, colon, value, comma, ...
+        return [
+            (self.data[x + 1 : colon], colon + 1, y)
+            for x, colon, y in zip(bounds[::2], bounds[1::2], bounds[2::2])
+        ]
+
+    def walk(self, tree: Tree, a: int, b: int) -> Any:
+        start = self.start_of(a, b)
+        if not tree or self.data[start] not in b"{[":
+            return self.plan.validator(tree).validate_json(self.data[a:b])
+
+        if is_wildcard(tree):
+            record = next(iter(tree.values()))
+            validator = self.plan.validator(record)
+            items = (
+                (key, validator.validate_json(self.data[x:y]))
+                for key, x, y in self.entries(a, b)
+            )
+            if "[]" in tree:
+                return [value for _, value in items]
+            return {json.loads(key): value for key, value in items}  # type: ignore
+
+        result = {}
+        for key, x, y in self.entries(a, b):
+            name = json.loads(key)  # type: ignore
+            if name in tree:
+                result[name] = self.walk(tree[name], x, y)
+        return result
+
+
+def load_projected(data: bytes | str, *fields: str) -> Any:
+    """Parse the JSON `data`, keeping only `fields`"""
+    if isinstance(data, str):
+        data = data.encode()
+    steps = plan(fields)
+    return Document(data, steps).walk(steps.tree, 0, len(data))
@@ -0,0 +1,121 @@
+"""Integrity checks for the exported character skeletons.
+
+Every pose listed in the `meta.json` of a character needs its `.skel`, its
+`.atlas` and the texture pages named in that atlas next to them.
+"""
+
+import json
+import os
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Literal
+
+from pydantic import BaseModel
+
+from torappu.consts import REPORT_DIR
+from torappu.core.utils import write_atomic
+
+SPINE_REPORT_PATH = REPORT_DIR / "char_spine.json"
+
+
+class SpineIssue(BaseModel):
+    char: str
+    path: str
+    problem: Literal["missing", "invalid"]
+    detail: str = ""
+
+
+class SpineReport(BaseModel):
+    checked: list[str]
+    issues: list[SpineIssue]
+
+
+def atlas_pages(atlas_path: Path) -> list[str]:
+    """Names of the texture pages of a Spine atlas"""
+    pages: list[str] = []
+    previous = ""
+    with open(atlas_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            # a page starts with its file name, after a blank line
+            if line and not previous and ":" not in line:
+                pages.append(line)
+            previous = line
+
+    return pages
+
+
+def check_char(char_dir: Path) -> list[SpineIssue]:
+    """Check the files of every pose in the `meta.json` of `char_dir`"""
+    char = char_dir.name
+    meta_path = char_dir / "meta.json"
+    if not meta_path.is_file():
+        return [SpineIssue(char=char, path=str(meta_path), problem="missing")]
+
+    try:
+        meta = json.loads(meta_path.read_text("utf-8"))
+    except ValueError as e:
+        return [
+            SpineIssue(char=char, path=str(meta_path), problem="invalid", detail=str(e))
+        ]
+
+    issues: list[SpineIssue] = []
+    for skin_poses in meta.get("skin", {}).values():
+        for pose in skin_poses.values():
+            file_path = char_dir / pose.get("file", "")
+            skel_path = file_path.with_suffix(".skel")
+            if not skel_path.is_file():
+                issues.append(
+                    SpineIssue(char=char, path=str(skel_path), problem="missing")
+                )
+
+            atlas_path = file_path.with_suffix(".atlas")
+            if not atlas_path.is_file():
+                issues.append(
+                    SpineIssue(char=char, path=str(atlas_path), problem="missing")
+                )
+                continue
+            try:
+                pages = atlas_pages(atlas_path)
+            except (OSError, UnicodeDecodeError) as e:
+                issues.append(
+                    SpineIssue(
+                        char=char,
+                        path=str(atlas_path),
+                        problem="invalid",
+                        detail=str(e),
+                    )
+                )
+                continue
+            if not pages:
+                issues.append(
+                    SpineIssue(
+                        char=char,
+                        path=str(atlas_path),
+                        problem="invalid",
+                        detail="no texture pages",
+                    )
+                )
+            for page in pages:
+                image_path = atlas_path.parent / page
+                if not image_path.is_file():
+                    issues.append(
+                        SpineIssue(char=char, path=str(image_path), problem="missing")
+                    )
+
+    return issues
+
+
+def check_chars(char_dirs: Iterable[Path], workers: int | None = None) -> SpineReport:
+    """Check `char_dirs` on a pool of threads, as the checks mostly wait on disk"""
+    char_dirs = sorted(char_dirs)
+    with ThreadPoolExecutor(workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        results = pool.map(check_char, char_dirs)
+        issues = [issue for result in results for issue in result]
+
+    return SpineReport(checked=[char_dir.name for char_dir in char_dirs], issues=issues)
+
+
+def write_report(report: SpineReport, path: Path = SPINE_REPORT_PATH):
+    write_atomic(path, report.model_dump_json(indent=2))
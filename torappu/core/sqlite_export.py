@@ -0,0 +1,145 @@
+"""Export gamedata tables of records to SQLite.
+
+A table whose top level is an object of records (objects keyed by id), like
+`character_table`, becomes an SQL table of the same name. Otherwise, every
+top-level member that is such an object becomes `<table>__<member>`, like
+`item_table__items` or `stage_table__stages`.
+
+Rows are keyed by the id in the `_key` primary key column. Each field of the
+records gets a column, scalars as they are and nested values as JSON text,
+which SQLite's JSON functions can query. Fields whose names differ only in
+case from an earlier one go to an `_extra` JSON object, and records with
+more than `MAX_COLUMNS` fields in total to a single `_value` JSON column.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+from torappu.log import logger
+
+# SQLite allows 2000 columns by default; wider records are stored whole
+MAX_COLUMNS = 500
+# lower-cased names of the columns added to the fields
+RESERVED = ("_key", "_extra")
+
+
+def is_records(value: Any) -> bool:
+    return (
+        isinstance(value, dict)
+        and len(value) > 0
+        and all(isinstance(record, dict) for record in value.values())
+    )
+
+
+def record_tables(name: str, table: Any) -> dict[str, dict[str, dict[str, Any]]]:
+    """SQL tables of the gamedata `table`, by name"""
+    # members that are objects of records themselves make a container
+    if is_records(table) and not any(map(is_records, table.values())):
+        return {name: table}
+    if not isinstance(table, dict):
+        return {}
+
+    return {
+        f"{name}__{member}": value
+        for member, value in table.items()
+        if is_records(value)
+    }
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def column_value(value: Any) -> Any:
+    if isinstance(value, dict | list):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return value
+
+
+def table_columns(records: dict[str, dict]) -> tuple[list[str], bool] | None:
+    """Columns for the fields of `records`, in order of first appearance.
+
+    SQLite identifiers ignore case, so only the first spelling of a field
+    gets a column and the bool tells if the others need `_extra`. `None`
+    means too many fields for columns, as in objects keyed by ids.
+    """
+    columns: dict[str, str] = {}
+    collided = False
+    for record in records.values():
+        for field in record:
+            name = columns.setdefault(field.lower(), field)
+            collided = collided or name != field
+    if len(columns) > MAX_COLUMNS:
+        return None
+
+    for reserved in RESERVED:
+        if columns.pop(reserved, None) is not None:
+            collided = True
+    return list(columns.values()), collided
+
+
+def write_table(db: sqlite3.Connection, name: str, records: dict[str, dict]):
+    layout = table_columns(records)
+    if layout is None:
+        db.execute(f"CREATE TABLE {quote(name)} (_key TEXT PRIMARY KEY, _value)")
+        db.executemany(
+            f"INSERT INTO {quote(name)} VALUES (?, ?)",
+            ((key, column_value(record)) for key, record in records.items()),
+        )
+        return
+
+    columns, collided = layout
+    extra = ", _extra" if collided else ""
+    db.execute(
+        f"CREATE TABLE {quote(name)} (_key TEXT PRIMARY KEY"
+        + "".join(f", {quote(column)}" for column in columns)
+        + f"{extra}) WITHOUT ROWID"
+    )
+
+    def row(key: str, record: dict[str, Any]) -> tuple:
+        values = [column_value(record.get(column)) for column in columns]
+        if collided:
+            rest = {k: v for k, v in record.items() if k not in columns}
+            values.append(column_value(rest) if rest else None)
+        return key, *values
+
+    db.executemany(
+        f"INSERT INTO {quote(name)} VALUES (?{', ?' * (len(columns) + bool(extra))})",
+        (row(key, record) for key, record in records.items()),
+    )
+
+
+def export_tables(json_dir: Path, db_path: Path):
+    """Write the record tables of every JSON file in `json_dir` to `db_path`.
+
+    The database is built beside `db_path` and replaces it when complete.
+    A table that cannot be written is left out with a warning.
+    """
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = db_path.with_name(f".{db_path.name}")
+    temp_path.unlink(missing_ok=True)
+    try:
+        db = sqlite3.connect(temp_path)
+        try:
+            for json_path in sorted(json_dir.glob("*.json")):
+                try:
+                    table = json.loads(json_path.read_text("utf-8"))
+                except ValueError:
+                    logger.warning(f"{json_path} is not JSON, skipped")
+                    continue
+                for name, records in record_tables(json_path.stem, table).items():
+                    try:
+                        with db:
+                            write_table(db, name, records)
+                    except sqlite3.Error as e:
+                        logger.warning(f"Skipped table {name}: {e}")
+                        db.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+        finally:
+            db.close()
+        os.replace(temp_path, db_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
@@ -1,21 +1,76 @@
 import asyncio
+import hashlib
+import json
+import os
 import subprocess
+from collections import defaultdict
 from pathlib import Path
+from tempfile import NamedTemporaryFile
 from typing import ClassVar
 
-import UnityPy
-from pydub import AudioSegment
+import anyio
 from UnityPy.classes import AudioClip
+from UnityPy.helpers.ResourceReader import get_resource_data
 
+from torappu import get_config
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
+from torappu.core.utils import run_sync, write_atomic
 from torappu.log import logger
 from torappu.models import Diff
 
 from .task import Task
-from .utils import build_container_path, read_obj
+from .utils import bundle_may_contain, get_bundle_index, read_obj
 
 AUDIO_DIR = STORAGE_DIR / "asset" / "raw" / "audio"
+BANK_DIR = STORAGE_DIR / "asset" / "raw" / "audio_bank"
+# hashes of the clips each combined bank was built from
+BANK_SOURCES_PATH = BANK_DIR / ".sources.json"
+
+config = get_config()
+
+
+def clip_hash(clip: AudioClip) -> str:
+    """SHA-256 of the raw sample data of `clip`, as stored in the bundle"""
+    if clip.m_AudioData:
+        data = clip.m_AudioData
+    else:
+        resource = clip.m_Resource
+        data = get_resource_data(
+            resource.m_Source,
+            clip.object_reader.assets_file,  # type: ignore
+            resource.m_Offset,
+            resource.m_Size,
+        )
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_unchanged(path: Path, digest: str) -> bool:
+    """Whether the outputs of the clip at `path` were made from `digest`"""
+    hash_path = path.with_suffix(".sha256")
+    return (
+        hash_path.is_file()
+        and hash_path.read_text() == digest
+        and path.with_suffix(".mp3").is_file()
+        and (not config.keep_wav or path.is_file())
+    )
+
+
+def recorded_hash(mp3_path: Path) -> str:
+    """Hash recorded next to an extracted clip, or the hash of its MP3"""
+    hash_path = mp3_path.with_suffix(".sha256")
+    if hash_path.is_file():
+        return hash_path.read_text()
+
+    return hashlib.sha256(mp3_path.read_bytes()).hexdigest()
+
+
+@run_sync
+def read_samples(clip: AudioClip) -> dict[str, bytes]:
+    """Decode the samples of `clip` to WAV, off the event loop"""
+    return clip.samples
 
 
 class Audio(Task):
@@ -25,6 +80,10 @@ class Audio(Task):
         super().__init__(client)
 
         self.ab_list: set[str] = set()
+        # bounds the running ffmpeg processes and the samples waiting for one
+        self.encode_slots = anyio.Semaphore(config.audio_workers or os.cpu_count() or 1)
+        # samples of one clip, or clips sharing a path, must not encode at once
+        self.path_locks: defaultdict[Path, anyio.Lock] = defaultdict(anyio.Lock)
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
@@ -36,87 +95,182 @@ class Audio(Task):
         return len(self.ab_list) > 0
 
     async def extract(self, real_path: str, ab_path: str):
-        env = UnityPy.load(real_path)
-        container_map = build_container_path(env)
-        for obj in filter(lambda obj: obj.type.name == "AudioClip", env.objects):
-            if (clip := read_obj(AudioClip, obj)) is None:
-                continue
-            for data in clip.samples.values():
+        if not bundle_may_contain(real_path, "AudioClip"):
+            return
+
+        env = load_bundle(real_path)
+        container_map = get_bundle_index(real_path, env).container
+        async with anyio.create_task_group() as tg:
+            for obj in filter(lambda obj: obj.type.name == "AudioClip", env.objects):
+                if (clip := read_obj(AudioClip, obj)) is None:
+                    continue
                 if clip.object_reader is None:
                     continue
                 path = AUDIO_DIR / container_map[clip.object_reader.path_id].replace(
                     "dyn/audio/sound_beta_2/", ""
                 ).replace(".ogg", ".wav").replace("#", "__")
                 path.parent.mkdir(parents=True, exist_ok=True)
-                path.write_bytes(data)
-                await self.mp3(str(path))
+
+                digest = await run_sync(clip_hash)(clip)
+                if is_unchanged(path, digest):
+                    continue
+
+                # earlier clips keep encoding while this one is decoded
+                samples = await read_samples(clip)
+                for data in samples.values():
+                    await self.encode_slots.acquire()
+                    tg.start_soon(self.encode, data, path, digest)
         logger.debug(f"unpacked {ab_path}")
 
-    async def mp3(self, path: str):
-        # ffmpeg -y -f wav -i /tmp/tmp7g1n0ag2 -f mp3 /tmp/tmpywtkkjwa
+    async def encode(self, data: bytes, path: Path, digest: str):
+        try:
+            async with self.path_locks[path]:
+                if config.keep_wav:
+                    await anyio.Path(path).write_bytes(data)
+                if await self.mp3(data, path.with_suffix(".mp3")):
+                    await anyio.Path(path.with_suffix(".sha256")).write_text(digest)
+        finally:
+            self.encode_slots.release()
+
+    async def mp3(self, data: bytes, dest: Path) -> bool:
+        # ffmpeg -y -f wav -i pipe:0 -f mp3 /tmp/tmpywtkkjwa
         proc = await asyncio.create_subprocess_exec(
             "ffmpeg",
             "-y",
             "-f",
             "wav",
             "-i",
-            path,
+            "pipe:0",
             "-f",
             "mp3",
-            path.replace(".wav", ".mp3"),
+            str(dest),
+            stdin=subprocess.PIPE,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
-        await proc.wait()
+        await proc.communicate(data)
+        if proc.returncode != 0:
+            logger.warning(f"ffmpeg failed to encode {dest}")
+            return False
+
+        return True
+
+    async def concat(self, clips: list[Path], dest: Path) -> bool:
+        """Join `clips` (MP3 paths) into `dest` with ffmpeg's concat demuxer.
+
+        Encodes once from the WAVs when all of them were kept, otherwise
+        copies the MP3 frames without decoding them.
+        """
+        wavs = [clip.with_suffix(".wav") for clip in clips]
+        if all(wav.is_file() for wav in wavs):
+            inputs, codec = wavs, ["-b:a", "128k"]
+        else:
+            inputs, codec = clips, ["-c", "copy"]
+
+        with NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            for path in inputs:
+                escaped = str(path.absolute()).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        temp_path = dest.with_name(f".{dest.name}")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                f.name,
+                *codec,
+                "-f",
+                "mp3",
+                str(temp_path),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            await proc.wait()
+        finally:
+            os.unlink(f.name)
+
+        if proc.returncode != 0:
+            logger.warning(f"ffmpeg failed to concat {dest}")
+            temp_path.unlink(missing_ok=True)
+            return False
+
+        os.replace(temp_path, dest)
+        return True
+
+    async def make_bank(
+        self, name: str, clips: list[Path], dest: Path, sources: dict[str, list[str]]
+    ):
+        async with self.encode_slots:
+            hashes = [await run_sync(recorded_hash)(clip) for clip in clips]
+            if sources.get(name) == hashes and dest.is_file() and not dest.is_symlink():
+                return
 
-    def combie(self, intro_path: Path | None, loop_path: Path, combie_path: Path):
-        intro = AudioSegment.from_mp3(intro_path)
-        loop = AudioSegment.from_mp3(loop_path)
-        intro = intro + loop
-        intro.export(combie_path, format="mp3", bitrate="128k")
+            logger.debug(f"combie {' and '.join(map(str, clips))} to {dest}")
+            if await self.concat(clips, dest):
+                sources[name] = hashes
 
-    def make_banks(self):
+    async def make_banks(self):
         audio_data = self.get_gamedata("excel/audio_data.json")
-        base_dir = STORAGE_DIR / "asset" / "raw" / "audio_bank"
-        base_dir.mkdir(parents=True, exist_ok=True)
-        for bank in audio_data["bgmBanks"]:
-            dist = base_dir / (bank["name"] + ".mp3")
-            if dist.exists():
-                continue
+        BANK_DIR.mkdir(parents=True, exist_ok=True)
+        sources: dict[str, list[str]] = (
+            json.loads(BANK_SOURCES_PATH.read_text("utf-8"))
+            if BANK_SOURCES_PATH.is_file()
+            else {}
+        )
 
-            intro_path: None | str = None
-            loop_path: None | str = None
+        async with anyio.create_task_group() as tg:
+            for bank in audio_data["bgmBanks"]:
+                dist = BANK_DIR / (bank["name"] + ".mp3")
 
-            if bank["intro"]:
-                tmp = bank["intro"].lower().replace("audio/sound_beta_2/", "") + ".mp3"
+                intro_path: None | str = None
+                loop_path: None | str = None
 
-                if (AUDIO_DIR / tmp).exists() or (AUDIO_DIR / tmp).is_symlink():
-                    intro_path = tmp
-                else:
-                    logger.debug(f"intro {tmp} not exists")
-            if bank["loop"]:
-                tmp = bank["loop"].lower().replace("audio/sound_beta_2/", "") + ".mp3"
-                if (AUDIO_DIR / tmp).exists() or (AUDIO_DIR / tmp).is_symlink():
-                    loop_path = tmp
-                else:
-                    logger.debug(f"loop {tmp} not exists")
+                if bank["intro"]:
+                    tmp = (
+                        bank["intro"].lower().replace("audio/sound_beta_2/", "")
+                        + ".mp3"
+                    )
 
-            if intro_path is None and loop_path is None:
-                continue
-            if loop_path is None:
-                logger.debug(f"make link {dist} to {intro_path}")
-                dist.symlink_to("../audio/" + intro_path)  # type: ignore
-                continue
-            if intro_path is None:
-                logger.debug(f"make link {dist} to {loop_path}")
-                dist.symlink_to("../audio/" + loop_path)
-                continue
+                    if (AUDIO_DIR / tmp).exists() or (AUDIO_DIR / tmp).is_symlink():
+                        intro_path = tmp
+                    else:
+                        logger.debug(f"intro {tmp} not exists")
+                if bank["loop"]:
+                    tmp = (
+                        bank["loop"].lower().replace("audio/sound_beta_2/", "") + ".mp3"
+                    )
+                    if (AUDIO_DIR / tmp).exists() or (AUDIO_DIR / tmp).is_symlink():
+                        loop_path = tmp
+                    else:
+                        logger.debug(f"loop {tmp} not exists")
+
+                if intro_path is None and loop_path is None:
+                    continue
+                if loop_path is None or intro_path is None:
+                    if dist.exists() or dist.is_symlink():
+                        continue
+                    target = "../audio/" + (loop_path or intro_path)  # type: ignore
+                    logger.debug(f"make link {dist} to {target}")
+                    dist.symlink_to(target)
+                    continue
+
+                tg.start_soon(
+                    self.make_bank,
+                    bank["name"],
+                    [AUDIO_DIR / intro_path, AUDIO_DIR / loop_path],
+                    dist,
+                    sources,
+                )
 
-            logger.debug(f"combie {intro_path} and {loop_path} to {dist}")
-            self.combie(AUDIO_DIR / intro_path, AUDIO_DIR / loop_path, dist)
+        write_atomic(BANK_SOURCES_PATH, json.dumps(sources))
 
         for key, value in audio_data["bankAlias"].items():
-            path = base_dir / (key + ".mp3")
+            path = BANK_DIR / (key + ".mp3")
             if path.exists() or path.is_symlink():
                 continue
             source = "./" + value + ".mp3"
@@ -128,4 +282,4 @@ class Audio(Task):
         await asyncio.gather(
             *(self.extract(real_path, ab_path) for ab_path, real_path in paths)
         )
-        self.make_banks()
+        await self.make_banks()
@@ -1,10 +1,11 @@
 from typing import ClassVar
 
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
+from torappu.core.output import save_image_async
 from torappu.core.task.audio import read_obj
 from torappu.models import Diff
 
@@ -31,14 +32,14 @@ class BuildSkill(Task):
 
         return len(self.ab_list) > 0
 
-    def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+    async def unpack(self, ab_path: str):
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if data := read_obj(Sprite, obj):
-                data.image.save(BASE_PATH / f"{data.m_Name}.png")
+                await save_image_async(data.image, BASE_PATH / f"{data.m_Name}.png")
 
     async def start(self):
         paths = await self.client.resolves(list(self.ab_list))
         BASE_PATH.mkdir(parents=True, exist_ok=True)
         for _, ab_path in paths:
-            self.unpack(ab_path)
+            await self.unpack(ab_path)
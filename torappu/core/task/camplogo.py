@@ -1,11 +1,12 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
-from torappu.core.task.utils import build_container_path, read_obj
+from torappu.core.bundle import load_bundle
+from torappu.core.output import save_image_async
+from torappu.core.task.utils import bundle_may_contain, get_bundle_index, read_obj
 from torappu.models import Diff
 
 from .task import Task
@@ -17,8 +18,11 @@ class CampLogo(Task):
     priority: ClassVar[int] = 3
 
     async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
-        container_map = build_container_path(env)
+        if not bundle_may_contain(ab_path, "Sprite"):
+            return
+
+        env = load_bundle(ab_path)
+        container_map = get_bundle_index(ab_path, env).container
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if texture := read_obj(Sprite, obj):
                 if texture.object_reader is None:
@@ -28,7 +32,7 @@ class CampLogo(Task):
                     container_path.replace("dyn/arts/camplogo/", "")
                 )
                 path.parent.mkdir(parents=True, exist_ok=True)
-                texture.image.save(path)
+                await save_image_async(texture.image, path)
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
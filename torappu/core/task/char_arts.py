@@ -1,17 +1,25 @@
 from typing import TYPE_CHECKING, ClassVar, cast
 
 import anyio
-import UnityPy
 from UnityPy.classes import (
     MonoBehaviour,
     Sprite,
 )
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
+from torappu.core.output import save_image_async
 from torappu.models import Diff
 
 from .task import Task
-from .utils import get_tex_env_by_key, merge_alpha, read_obj
+from .utils import (
+    bundle_may_contain,
+    get_bundle_index,
+    get_tex_env_by_key,
+    merge_alpha,
+    read_obj,
+    script_may_be,
+)
 
 if TYPE_CHECKING:
     from UnityPy.classes import (
@@ -27,10 +35,16 @@ class CharArts(Task):
     priority: ClassVar[int] = 3
 
     async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        if not bundle_may_contain(ab_path, "MonoBehaviour", "Image"):
+            return
+
+        env = load_bundle(ab_path)
         await self.load_anon(env)
 
+        scripts = get_bundle_index(ab_path, env, scripts=True).scripts
         for obj in filter(lambda obj: obj.type.name == "MonoBehaviour", env.objects):
+            if not script_may_be(scripts, obj.path_id, "Image"):
+                continue
             if (behaviour := read_obj(MonoBehaviour, obj)) is None:
                 continue
             script = behaviour.m_Script.read()
@@ -53,7 +67,11 @@ class CharArts(Task):
                 rgb_texture: Texture2D = rgb_texture_pptr.read()
                 alpha_texture: Texture2D = alpha_texture_pptr.read()
                 merged_image, _ = merge_alpha(alpha_texture, rgb_texture)
-                merged_image.save(BASE_DIR.joinpath(f"{rgb_texture.m_Name}.png"))
+                await save_image_async(
+                    merged_image,
+                    BASE_DIR.joinpath(f"{rgb_texture.m_Name}.png"),
+                    thumbnails=True,
+                )
             else:
                 if not behaviour.m_Sprite:  # type: ignore
                     # No texture or sprite, skip
@@ -62,7 +80,11 @@ class CharArts(Task):
                 if isinstance(behaviour, Sprite) is False:
                     continue
                 rgb_texture = sprite.m_RD.texture.read()  # type:ignore Type "UnityPy.classes.generated.Texture2D" is not assignable to declared type "UnityPy.classes.legacy_patch.Texture2D.Texture2D"
-                rgb_texture.image.save(BASE_DIR.joinpath(f"{rgb_texture.m_Name}.png"))
+                await save_image_async(
+                    rgb_texture.image,
+                    BASE_DIR.joinpath(f"{rgb_texture.m_Name}.png"),
+                    thumbnails=True,
+                )
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
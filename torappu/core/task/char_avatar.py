@@ -1,11 +1,11 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
 from UnityPy.classes import Texture2D
 
 from torappu.consts import STORAGE_DIR
-from torappu.core.task.utils import read_obj
+from torappu.core.output import save_image_async
+from torappu.core.task.utils import load_objects
 from torappu.models import Diff
 
 from .task import Task
@@ -17,10 +17,10 @@ class CharAvatar(Task):
     priority: ClassVar[int] = 3
 
     async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
-        for obj in filter(lambda obj: obj.type.name == "Texture2D", env.objects):
-            if texture := read_obj(Texture2D, obj):
-                texture.image.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+        for _, texture in load_objects(ab_path, Texture2D):
+            await save_image_async(
+                texture.image, BASE_DIR.joinpath(f"{texture.m_Name}.png")
+            )
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
@@ -1,14 +1,26 @@
+from collections.abc import Iterator
 from typing import TYPE_CHECKING, ClassVar, cast
 
 import anyio
-import UnityPy
+import numpy as np
+from PIL import Image
 from UnityPy.classes import MonoBehaviour
 
 from torappu.consts import STORAGE_DIR
+from torappu.core import imageops
+from torappu.core.bundle import load_bundle
+from torappu.core.output import save_image
+from torappu.core.utils import run_async, run_sync
 from torappu.models import Diff
 
 from .task import Task
-from .utils import merge_alpha, read_obj
+from .utils import (
+    bundle_may_contain,
+    get_bundle_index,
+    merge_alpha,
+    read_obj,
+    script_may_be,
+)
 
 if TYPE_CHECKING:
     from UnityPy.classes import Texture2D
@@ -31,18 +43,40 @@ class SpriteMetadata:
     rotate: int
 
 
+def slice_sprites(
+    atlas: np.ndarray, sprites: "list[SpriteMetadata]", size: int
+) -> Iterator[tuple[str, Image.Image]]:
+    """Cut `sprites` out of the merged `atlas` array"""
+    for sprite in sprites:
+        rect = sprite.rect
+        # Hypergryph's coordinate system is first dimension
+        # different from Pillow's fourth dimension
+        # so we need to flip the y-axis
+        box = (rect.x, size - rect.y - rect.h, rect.x + rect.w, size - rect.y)
+        # rotated sprites are stored 90 degree clockwise
+        cropped = imageops.crop(atlas, box, rotate=sprite.rotate == 1)
+        yield sprite.name, Image.fromarray(cropped)
+
+
 class CharPortrait(Task):
     priority: ClassVar[int] = 3
 
-    async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
-        await self.load_anon(env)
+    @run_sync
+    def unpack(self, ab_path: str):
+        if not bundle_may_contain(ab_path, "MonoBehaviour", "UIAtlasTextureRef"):
+            return
+
+        env = load_bundle(ab_path)
+        run_async(self.load_anon)(env)
 
+        scripts = get_bundle_index(ab_path, env, scripts=True).scripts
         for obj in filter(lambda obj: obj.type.name == "MonoBehaviour", env.objects):
+            if not script_may_be(scripts, obj.path_id, "UIAtlasTextureRef"):
+                continue
             if (data := read_obj(MonoBehaviour, obj)) is None:
                 continue
             if data.m_Script.read().m_Name != "UIAtlasTextureRef":
-                return
+                continue
 
             # unpack atlas
             rgb_texture = cast("Texture2D", data._atlas.texture.read())
@@ -51,27 +85,12 @@ class CharPortrait(Task):
             texture, _ = merge_alpha(alpha_texture, rgb_texture)
             atlas_dest = BASE_PATH / "atlas"
             atlas_dest.mkdir(parents=True, exist_ok=True)
-            texture.save(atlas_dest / f"{data.m_Name}.png")
+            save_image(texture, atlas_dest / f"{data.m_Name}.png")
 
             # unpack sprites
             sprites = cast("list[SpriteMetadata]", data._sprites)  # type: ignore
-            for sprite in sprites:
-                rect = sprite.rect
-                # Hypergryph's coordinate system is first dimension
-                # different from Pillow's fourth dimension
-                # so we need to flip the y-axis
-                cropped = texture.crop(
-                    (
-                        rect.x,
-                        size - rect.y - rect.h,
-                        rect.x + rect.w,
-                        size - rect.y,
-                    )
-                )
-                if sprite.rotate == 1:
-                    # 90 degree clockwise
-                    cropped = cropped.rotate(-90, expand=True)
-                cropped.save(BASE_PATH / f"{sprite.name}.png")
+            for name, cropped in slice_sprites(np.asarray(texture), sprites, size):
+                save_image(cropped, BASE_PATH / f"{name}.png", thumbnails=True)
 
     async def start(self):
         paths = await self.client.resolves(list(self.ab_list))
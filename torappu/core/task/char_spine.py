@@ -2,21 +2,27 @@ import asyncio
 import re
 from typing import TYPE_CHECKING, ClassVar, cast
 
-import UnityPy
+import anyio
 from pydantic import BaseModel, TypeAdapter
 from UnityPy.classes import GameObject
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import dependency_cache, load_bundle
 from torappu.core.client import Client
+from torappu.core.output import encode_batch, flush_encoded, save_image
+from torappu.core.spine_check import check_chars, write_report
+from torappu.core.utils import run_process, run_sync, write_atomic
 from torappu.log import logger
 from torappu.models import Diff
 
 from .task import Task
-from .utils import build_container_path, m_script_to_bytes, material2img, read_obj
+from .utils import get_bundle_index, m_script_to_bytes, material2img, read_obj
 
 if TYPE_CHECKING:
     from UnityPy.classes import Material, MonoBehaviour, PPtr, TextAsset
 
+BASE_DIR = STORAGE_DIR / "asset" / "raw" / "char_spine"
+
 
 class FileConfig(BaseModel):
     file: str
@@ -28,103 +34,59 @@ class SpineConfig(BaseModel):
     skin: dict[str, dict[str, FileConfig]]
 
 
-class CharSpine(Task):
-    priority: ClassVar[int] = 2
+def unpack_skeleton(data: "MonoBehaviour", path: str) -> str:
+    base_dir = BASE_DIR / path
+    skel = cast("TextAsset", data.skeletonJSON.read())  # type: ignore
+    skel_name: str = skel.m_Name.replace("#", "_")
+    skel_dest_path = base_dir / skel_name
 
-    def __init__(self, client: Client) -> None:
-        super().__init__(client)
+    if skel_name.endswith(".skel"):
+        skel_name = skel_name.replace(".skel", "")
 
-        self.ab_list: set[str] = set()
-        self.changed_char: dict[str, SpineConfig] = {}
-        self.char_map: dict[str, str] = {}
-        self.skin_map: dict[str, str] = {}
+    if not skel_dest_path.name.endswith(".skel"):
+        skel_dest_path = skel_dest_path.with_suffix(".skel")
 
-    def check(self, diff_list: list[Diff]) -> bool:
-        diff_set = {diff.path for diff in diff_list}
-        self.ab_list = {
-            bundle
-            for asset, bundle in self.client.asset_to_bundle.items()
-            if (
-                asset.startswith(
-                    "battle/prefabs/skins/character"
-                )  # 干员以及token的皮肤
-                or asset.startswith("building/vault/characters")  # 干员的基建
-                or asset.startswith("battle/prefabs/[uc]tokens")  # token的初始
-            )
-            and bundle in diff_set
-        }
+    if not base_dir.exists():
+        base_dir.mkdir(parents=True, exist_ok=True)
 
-        return len(self.ab_list) > 0
+    with open(skel_dest_path, "wb") as f:
+        f.write(m_script_to_bytes(skel.m_Script))
 
-    def update_config(self, name: str, skin: str, side: str, filename: str):
-        if name not in self.char_map:
-            logger.error(f"{name} not found in gamedata, skipped")
-            return
-        self.changed_char.setdefault(
-            name,
-            SpineConfig(
-                name=self.char_map[name],
-                skin={},
-                prefix=f"https://torappu.prts.wiki/assets/char_spine/{name}/",
-            ),
-        )
-        skin_name = "默认" if skin == "defaultskin" else self.skin_map.get(skin, None)
-        assert skin_name is not None, f"skin {skin} not found"
-        self.changed_char[name].skin.setdefault(skin_name, {})
-        side_map = {
-            "spine": "战斗",
-            "front": "正面",
-            "back": "背面",
-            "down": "向下",
-            "build": "基建",
-        }
-        self.changed_char[name].skin[skin_name][side_map[side]] = FileConfig(
-            file=f"{skin}/{side}/{filename}"
-        )
+    atlas_assets: list[PPtr] = data.atlasAssets  # type: ignore
+    for pptr in atlas_assets:
+        atlas_mono_behaviour: MonoBehaviour = pptr.read()
+        atlas: TextAsset = atlas_mono_behaviour.atlasFile.read()  # type: ignore
+        # 文件名上不能有`#`，都替换成`_`
+        atlas_content = re.sub(r"#([^.]*\.png)", r"_\1", atlas.m_Script)
+        with open(base_dir / atlas.m_Name.replace("#", "_"), "w") as f:
+            f.write(atlas_content)
+        materials: list[PPtr] = atlas_mono_behaviour.materials  # type: ignore
+        for mat_pptr in materials:
+            mat: Material = mat_pptr.read()
+            img, name = material2img(mat)
+            save_image(img, base_dir / (name.replace("#", "_") + ".png"))
+
+    return skel_name
+
+
+def unpack_bundle(
+    real_path: str, dependencies: list[str]
+) -> list[tuple[str, str, str, str]]:
+    """Export the skeletons of the bundle at `real_path`.
+
+    Runs in a worker process; the exported skeletons are returned for the
+    parent to merge into `meta.json`.
 
-    async def unpack_ab(self, real_path):
-        env = UnityPy.load(real_path)
-        await self.load_anon(env)
-
-        container_map = build_container_path(env)
-
-        def unpack(
-            data: "MonoBehaviour",
-            path: str,
-        ) -> str:
-            base_dir = STORAGE_DIR / "asset" / "raw" / "char_spine" / path
-            skel = cast("TextAsset", data.skeletonJSON.read())  # type: ignore
-            skel_name: str = skel.m_Name.replace("#", "_")
-            skel_dest_path = base_dir / skel_name
-
-            if skel_name.endswith(".skel"):
-                skel_name = skel_name.replace(".skel", "")
-
-            if not skel_dest_path.name.endswith(".skel"):
-                skel_dest_path = skel_dest_path.with_suffix(".skel")
-
-            if not base_dir.exists():
-                base_dir.mkdir(parents=True, exist_ok=True)
-
-            with open(skel_dest_path, "wb") as f:
-                f.write(m_script_to_bytes(skel.m_Script))
-
-            atlas_assets: list[PPtr] = data.atlasAssets  # type: ignore
-            for pptr in atlas_assets:
-                atlas_mono_behaviour: MonoBehaviour = pptr.read()
-                atlas: TextAsset = atlas_mono_behaviour.atlasFile.read()  # type: ignore
-                # 文件名上不能有`#`，都替换成`_`
-                atlas_content = re.sub(r"#([^.]*\.png)", r"_\1", atlas.m_Script)
-                with open(base_dir / atlas.m_Name.replace("#", "_"), "w") as f:
-                    f.write(atlas_content)
-                materials: list[PPtr] = atlas_mono_behaviour.materials  # type: ignore
-                for mat_pptr in materials:
-                    mat: Material = mat_pptr.read()
-                    img, name = material2img(mat)
-                    img.save(base_dir / (name.replace("#", "_") + ".png"))
-
-            return skel_name
+    :returns: (name, skin, side, skeleton name) of every exported skeleton;
+    """
+    with encode_batch():
+        env = load_bundle(real_path)
+        for path in dependencies:
+            dependency_cache.attach(env, path)
 
+        container_map = get_bundle_index(real_path, env).container
+
+        results: list[tuple[str, str, str, str]] = []
         for obj in filter(lambda obj: obj.type.name == "GameObject", env.objects):
             if (game_obj := read_obj(GameObject, obj)) is None:
                 continue
@@ -206,22 +168,103 @@ class CharSpine(Task):
                     break
                 data: MonoBehaviour = skeleton_data.read()
                 if data.m_Name.endswith("_SkeletonData"):
-                    if skel_name := unpack(data, f"{name}/{skin}/{side}"):
-                        self.update_config(name, skin, side, skel_name)
+                    if skel_name := unpack_skeleton(data, f"{name}/{skin}/{side}"):
+                        results.append((name, skin, side, skel_name))
                     break
 
-    async def unpack(self, ab_path: str):
+        flush_encoded()
+    return results
+
+
+@run_sync
+def write_meta(char: str, result: SpineConfig):
+    """Merge `result` into the `meta.json` of `char` and replace it atomically"""
+    meta_path = BASE_DIR / char / "meta.json"
+    if meta_path.is_file():
+        spine = TypeAdapter(SpineConfig).validate_json(
+            meta_path.read_text(encoding="utf-8")
+        )
+        result.skin = {**spine.skin, **result.skin}
+
+    write_atomic(meta_path, result.model_dump_json())
+
+
+class CharSpine(Task):
+    priority: ClassVar[int] = 2
+
+    def __init__(self, client: Client) -> None:
+        super().__init__(client)
+
+        self.ab_list: set[str] = set()
+        self.changed_char: dict[str, SpineConfig] = {}
+        self.char_map: dict[str, str] = {}
+        self.skin_map: dict[str, str] = {}
+
+    def check(self, diff_list: list[Diff]) -> bool:
+        diff_set = {diff.path for diff in diff_list}
+        self.ab_list = {
+            bundle
+            for asset, bundle in self.client.asset_to_bundle.items()
+            if (
+                asset.startswith(
+                    "battle/prefabs/skins/character"
+                )  # 干员以及token的皮肤
+                or asset.startswith("building/vault/characters")  # 干员的基建
+                or asset.startswith("battle/prefabs/[uc]tokens")  # token的初始
+            )
+            and bundle in diff_set
+        }
+
+        return len(self.ab_list) > 0
+
+    def update_config(self, name: str, skin: str, side: str, filename: str):
+        if name not in self.char_map:
+            logger.error(f"{name} not found in gamedata, skipped")
+            return
+        self.changed_char.setdefault(
+            name,
+            SpineConfig(
+                name=self.char_map[name],
+                skin={},
+                prefix=f"https://torappu.prts.wiki/assets/char_spine/{name}/",
+            ),
+        )
+        skin_name = "默认" if skin == "defaultskin" else self.skin_map.get(skin, None)
+        assert skin_name is not None, f"skin {skin} not found"
+        self.changed_char[name].skin.setdefault(skin_name, {})
+        side_map = {
+            "spine": "战斗",
+            "front": "正面",
+            "back": "背面",
+            "down": "向下",
+            "build": "基建",
+        }
+        self.changed_char[name].skin[skin_name][side_map[side]] = FileConfig(
+            file=f"{skin}/{side}/{filename}"
+        )
+
+    async def unpack(self, ab_path: str, dependencies: list[str]):
         real_path = await self.client.resolve(ab_path)
-        await self.unpack_ab(real_path)
+        for name, skin, side, skel_name in await run_process(
+            unpack_bundle, real_path, dependencies
+        ):
+            self.update_config(name, skin, side, skel_name)
 
     async def start(self):
-        char_table = self.get_gamedata("excel/character_table.json")
+        char_table = self.get_gamedata_fields("excel/character_table.json", "*.name")
         for char in char_table:
             self.char_map[char] = char_table[char]["name"]
-        patch_table = self.get_gamedata("excel/char_patch_table.json")
+        patch_table = self.get_gamedata_fields(
+            "excel/char_patch_table.json", "patchChars.*.name"
+        )
         for char in patch_table["patchChars"]:
             self.char_map[char] = patch_table["patchChars"][char]["name"]
-        skin_table = self.get_gamedata("excel/skin_table.json")
+        skin_table = self.get_gamedata_fields(
+            "excel/skin_table.json",
+            "charSkins.*.battleSkin.skinOrPrefabId",
+            "charSkins.*.displaySkin.skinName",
+            "charSkins.*.tokenSkinMap[].tokenSkinId",
+        )
         for skin in skin_table["charSkins"].values():
             skin_id = skin["battleSkin"]["skinOrPrefabId"]
             if (
@@ -241,18 +284,23 @@ class CharSpine(Task):
                 ]["skinName"]
 
         await asyncio.gather(*(self.client.resolve(ab) for ab in self.ab_list))
-        await asyncio.gather(*(self.unpack(ab) for ab in self.ab_list))
-
-        for char in filter(lambda c: c in self.char_map, self.changed_char):
-            meta_path = STORAGE_DIR.joinpath(
-                "asset", "raw", "char_spine", char, "meta.json"
+        dependencies = await self.anon_paths()
+        await asyncio.gather(*(self.unpack(ab, dependencies) for ab in self.ab_list))
+
+        changed = [c for c in self.changed_char if c in self.char_map]
+        async with anyio.create_task_group() as tg:
+            for char in changed:
+                tg.start_soon(write_meta, char, self.changed_char[char])
+
+        await self.validate(changed)
+
+    async def validate(self, chars: list[str]):
+        """Check the skeletons of `chars` and write the report for CI"""
+        report = await run_sync(check_chars)(BASE_DIR / char for char in chars)
+        await run_sync(write_report)(report)
+        for issue in report.issues:
+            logger.warning(f"spine {issue.char}: {issue.problem} {issue.path}")
+        if report.issues:
+            logger.error(
+                f"{len(report.issues)} spine issues in {len(chars)} characters"
             )
-            result = self.changed_char[char]
-
-            if meta_path.is_file():
-                spine = TypeAdapter(SpineConfig).validate_json(
-                    meta_path.read_text(encoding="utf-8")
-                )
-                result.skin = {**spine.skin, **result.skin}
-
-            meta_path.write_text(result.model_dump_json(), encoding="utf-8")
@@ -1,19 +1,141 @@
 import asyncio
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
 from typing import TYPE_CHECKING, ClassVar, cast
 
-import UnityPy
-from UnityPy.classes import GameObject, MonoBehaviour
+from UnityPy.classes import GameObject, MonoBehaviour, Texture2D
 
-from torappu.consts import STORAGE_DIR
+from torappu.consts import OUTPUT_STORE_DIR, STORAGE_DIR
+from torappu.core.bundle import dependency_cache, load_bundle
 from torappu.core.client import Client
+from torappu.core.output import encode_batch, flush_encoded, link_output, save_image
+from torappu.core.utils import DIR_MODE, run_process
 from torappu.models import Diff
 
 from .task import Task
-from .utils import build_container_path, m_script_to_bytes, material2img, read_obj
+from .utils import get_bundle_index, m_script_to_bytes, material2img, read_obj
 
 if TYPE_CHECKING:
     from UnityPy.classes import Material, PPtr, TextAsset
 
+BASE_DIR = STORAGE_DIR / "asset" / "raw" / "enemy_spine"
+# one directory per distinct skeleton, atlas and texture set
+STORE_DIR = OUTPUT_STORE_DIR / "enemy_spine"
+
+Atlases = list[tuple["TextAsset", list["Material"]]]
+
+
+def skeleton_hash(skel: "TextAsset", atlases: Atlases) -> str:
+    """Hash the files a skeleton exports to, without decoding its textures"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(skel.m_Name.encode())
+    digest.update(m_script_to_bytes(skel.m_Script))
+    for atlas, materials in atlases:
+        digest.update(atlas.m_Name.encode())
+        digest.update(m_script_to_bytes(atlas.m_Script))
+        for mat in materials:
+            for _, tex_env in mat.m_SavedProperties.m_TexEnvs:
+                if not tex_env.m_Texture:
+                    continue
+                texture = tex_env.m_Texture.read()
+                if not isinstance(texture, Texture2D):
+                    continue
+                digest.update(texture.m_Name.encode())
+                digest.update(texture.get_image_data())
+
+    return digest.hexdigest()
+
+
+def write_skeleton(skel: "TextAsset", atlases: Atlases, base_dir: Path):
+    with open(base_dir / skel.m_Name, "wb") as f:
+        f.write(m_script_to_bytes(skel.m_Script))
+
+    with encode_batch():
+        for atlas, materials in atlases:
+            with open(base_dir / atlas.m_Name, "wb") as f:
+                f.write(m_script_to_bytes(atlas.m_Script))
+            for mat in materials:
+                img, name = material2img(mat)
+                save_image(img, base_dir / (name + ".png"))
+
+        # an incomplete set must not end up in the store
+        flush_encoded()
+
+
+def unpack_skeleton(data: MonoBehaviour, path: str):
+    """Export the skeleton `data` to `path`.
+
+    Identical skeletons, e.g. of enemy variants, are written once under
+    `STORE_DIR` and hard linked to each of their paths.
+    """
+    skel = cast("TextAsset", data.skeletonJSON.read())  # type: ignore
+    atlases: Atlases = []
+    for pptr in cast("list[PPtr[MonoBehaviour]]", data.atlasAssets):  # type: ignore
+        atlas_mono_behaviour = pptr.deref_parse_as_object()
+        atlas = cast("TextAsset", atlas_mono_behaviour.atlasFile.read())  # type: ignore
+        materials = cast("list[PPtr[Material]]", atlas_mono_behaviour.materials)  # type: ignore
+        atlases.append(
+            (atlas, [mat_pptr.deref_parse_as_object() for mat_pptr in materials])
+        )
+
+    stored = STORE_DIR / skeleton_hash(skel, atlases)
+    if not stored.is_dir():
+        STORE_DIR.mkdir(parents=True, exist_ok=True)
+        temp_dir = Path(mkdtemp(dir=STORE_DIR, prefix="."))
+        try:
+            write_skeleton(skel, atlases, temp_dir)
+            # mkdtemp makes the directory private to the user
+            os.chmod(temp_dir, DIR_MODE)
+            os.rename(temp_dir, stored)
+        except OSError:
+            # another worker stored the same skeleton first
+            if not stored.is_dir():
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    base_dir = BASE_DIR / path
+    base_dir.mkdir(parents=True, exist_ok=True)
+    for file in stored.iterdir():
+        link_output(file, base_dir / file.name)
+
+
+def unpack_bundle(real_path: str, dependencies: list[str]):
+    """Export the enemy skeletons of the bundle at `real_path`, in a worker process"""
+    env = load_bundle(real_path)
+    for path in dependencies:
+        dependency_cache.attach(env, path)
+
+    container_map = get_bundle_index(real_path, env).container
+
+    for obj in filter(lambda obj: obj.type.name == "GameObject", env.objects):
+        if (game_obj := read_obj(GameObject, obj)) is None:
+            continue
+        if game_obj.m_Name == "Spine" and game_obj.object_reader is not None:
+            path = (
+                container_map[game_obj.object_reader.path_id]
+                .replace("dyn/battle/prefabs/enemies/", "")
+                .replace(".prefab", "")
+            )
+            for comp in filter(
+                lambda comp: comp.type.name == "MonoBehaviour",
+                game_obj.m_Components,
+            ):
+                skeleton_animation = cast("MonoBehaviour", comp.read())
+                if (
+                    skeleton_data := getattr(
+                        skeleton_animation, "skeletonDataAsset", None
+                    )
+                ) is None:
+                    continue
+                data: MonoBehaviour = skeleton_data.read()
+                if data.m_Name.endswith("_SkeletonData"):
+                    unpack_skeleton(data, path)
+                    break
+
 
 class EnemySpine(Task):
     priority: ClassVar[int] = 2
@@ -33,59 +155,11 @@ class EnemySpine(Task):
 
         return len(self.ab_list) > 0
 
-    async def unpack_ab(self, real_path):
-        env = UnityPy.load(real_path)
-        await self.load_anon(env)
-
-        container_map = build_container_path(env)
-
-        def unpack(data: MonoBehaviour, path: str):
-            base_dir = STORAGE_DIR / "asset" / "raw" / "enemy_spine" / path
-            base_dir.mkdir(parents=True, exist_ok=True)
-            skel = cast("TextAsset", data.skeletonJSON.read())  # type: ignore
-            with open(base_dir / skel.m_Name, "wb") as f:
-                f.write(m_script_to_bytes(skel.m_Script))
-            atlas_assets = cast("list[PPtr[MonoBehaviour]]", data.atlasAssets)  # type: ignore
-            for pptr in atlas_assets:
-                atlas_mono_behaviour = pptr.deref_parse_as_object()
-                atlas = cast("TextAsset", atlas_mono_behaviour.atlasFile.read())  # type: ignore
-                with open(base_dir / atlas.m_Name, "wb") as f:
-                    f.write(m_script_to_bytes(atlas.m_Script))
-                materials = cast("list[PPtr[Material]]", atlas_mono_behaviour.materials)  # type: ignore
-                for mat_pptr in materials:
-                    mat = mat_pptr.deref_parse_as_object()
-                    img, name = material2img(mat)
-                    img.save(base_dir / (name + ".png"))
-
-        for obj in filter(lambda obj: obj.type.name == "GameObject", env.objects):
-            if (game_obj := read_obj(GameObject, obj)) is None:
-                continue
-            if game_obj.m_Name == "Spine" and game_obj.object_reader is not None:
-                path = (
-                    container_map[game_obj.object_reader.path_id]
-                    .replace("dyn/battle/prefabs/enemies/", "")
-                    .replace(".prefab", "")
-                )
-                for comp in filter(
-                    lambda comp: comp.type.name == "MonoBehaviour",
-                    game_obj.m_Components,
-                ):
-                    skeleton_animation = cast("MonoBehaviour", comp.read())
-                    if (
-                        skeleton_data := getattr(
-                            skeleton_animation, "skeletonDataAsset", None
-                        )
-                    ) is None:
-                        continue
-                    data: MonoBehaviour = skeleton_data.read()
-                    if data.m_Name.endswith("_SkeletonData"):
-                        unpack(data, path)
-                        break
-
-    async def unpack(self, ab_path: str):
+    async def unpack(self, ab_path: str, dependencies: list[str]):
         real_path = await self.client.resolve(ab_path)
-        await self.unpack_ab(real_path)
+        await run_process(unpack_bundle, real_path, dependencies)
 
     async def start(self):
         await asyncio.gather(*(self.client.resolve(ab) for ab in self.ab_list))
-        await asyncio.gather(*(self.unpack(ab) for ab in self.ab_list))
+        dependencies = await self.anon_paths()
+        await asyncio.gather(*(self.unpack(ab, dependencies) for ab in self.ab_list))
@@ -1,11 +1,14 @@
 from typing import ClassVar
 
-import UnityPy
+import anyio
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
-from torappu.core.task.utils import read_obj
+from torappu.core.output import save_image
+from torappu.core.task.utils import read_obj, trim_bounds
+from torappu.core.utils import run_sync
 from torappu.models import Diff
 
 from .task import Task
@@ -31,36 +34,32 @@ class FurniturePreview(Task):
 
         return len(self.ab_list) > 0
 
+    @run_sync
     def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if (data := read_obj(Sprite, obj)) is None:
                 continue
             if not data.m_Name.endswith("_6"):
                 continue
-            scan = data.image.convert("L")
-            bottom = scan.height - 1
-            top = 0
-            basic_color: float = scan.getpixel((int(scan.width / 2), 0))  # type: ignore
-            while top < scan.height:
-                top += 1
-                color: float = scan.getpixel((int(scan.width / 2), top))  # type: ignore
-                if abs(color - basic_color) > 2:
-                    break
-
-            while bottom > 0:
-                bottom -= 1
-                color = scan.getpixel((int(scan.width / 2), bottom))  # type: ignore
-                if abs(color - basic_color) > 2:
-                    break
-
-            data.image.crop((0, top, scan.width, bottom)).save(
-                BASE_PATH / f"{data.m_Name}.png"
+            image = data.image
+            scan = image.convert("L")
+            # previews are letterboxed with the colour at the top center
+            bounds = trim_bounds(
+                scan,
+                tolerance=2,
+                axes="y",
+                background=scan.getpixel((scan.width // 2, 0)),  # type: ignore
             )
+            if bounds is not None:
+                image = image.crop(bounds)
+            save_image(image, BASE_PATH / f"{data.m_Name}.png")
             break
 
     async def start(self):
         paths = await self.client.resolves(list(self.ab_list))
         BASE_PATH.mkdir(parents=True, exist_ok=True)
-        for _, ab_path in paths:
-            self.unpack(ab_path)
+
+        async with anyio.create_task_group() as tg:
+            for _, ab_path in paths:
+                tg.start_soon(self.unpack, ab_path)
@@ -9,15 +9,16 @@ from tempfile import TemporaryDirectory
 from typing import ClassVar
 
 import bson
-import UnityPy
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
-from UnityPy.classes import TextAsset
 
-from torappu.consts import FBS_DIR, STORAGE_DIR
+from torappu.consts import FBS_DIR, GAMEDATA_SQLITE_DIR, STORAGE_DIR
+from torappu.core import gamedata_store
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
-from torappu.core.task.utils import m_script_to_bytes
+from torappu.core.sqlite_export import export_tables
+from torappu.core.task.utils import RawScript, read_raw_script
 from torappu.core.utils import run_sync
+from torappu.log import logger
 from torappu.models import Diff
 
 from .task import Task
@@ -96,6 +97,14 @@ signed_list = ["excel", "_table", "[uc]lua"]
 chat_mask = "UITpAi82pHAWwnzqHRMCwPonJLIB3WCl"
 
 
+def unpadded(data: bytes) -> memoryview:
+    """`data` without its PKCS#7 padding, as a view"""
+    size = data[-1] if data else 0
+    if not 1 <= size <= 16 or data[-size:] != bytes([size]) * size:
+        raise ValueError("Padding is incorrect.")
+    return memoryview(data)[:-size]
+
+
 class GameData(Task):
     priority: ClassVar[int] = 0
 
@@ -131,7 +140,7 @@ class GameData(Task):
         return any(signed in path for signed in signed_list)
 
     @run_sync
-    def _decode_flatbuffer(self, path: str, obj: TextAsset, fb_name: str):
+    def _decode_flatbuffer(self, path: str, script: RawScript, fb_name: str):
         tmp_dir = TemporaryDirectory()
         tmp_path = Path(tmp_dir.name)
 
@@ -139,7 +148,7 @@ class GameData(Task):
         output_path = tmp_path.joinpath(
             os.path.dirname(path.replace("dyn/gamedata/", ""))
         )
-        flatbuffer_data_path.write_bytes(m_script_to_bytes(obj.m_Script)[128:])
+        flatbuffer_data_path.write_bytes(script.view(128))
 
         params = [
             self.client.config.flatc_path,
@@ -185,30 +194,25 @@ class GameData(Task):
         tmp_dir.cleanup()
 
     @run_sync
-    def _decrypt(self, path: str, obj: TextAsset, is_signed: bool):
+    def _decrypt(self, path: str, script: RawScript, is_signed: bool):
         key: bytes = chat_mask[:16].encode()
-        iv = chat_mask[16:].encode()
-        cipher_data = (
-            bytearray(m_script_to_bytes(obj.m_Script))[128:]
-            if is_signed
-            else bytearray(m_script_to_bytes(obj.m_Script))
-        )
-        for i in range(16):
-            cipher_data[i] ^= iv[i]
-
-        cipher = AES.new(key, AES.MODE_CBC)
-        decipher = unpad(bytes(cipher.decrypt(cipher_data)), 16)
+        mask = chat_mask[16:].encode()
+        cipher_data = script.view(128 if is_signed else 0)
+        # the masked first block is only the IV of the rest
+        iv = bytes(a ^ b for a, b in zip(cipher_data[:16], mask))
+        decipher = AES.new(key, AES.MODE_CBC, iv=iv).decrypt(cipher_data[16:])
+        plain = unpadded(decipher)
         try:
             res = bytes(
                 json.dumps(
-                    bson.decode_document(decipher[16:], 0)[1],
+                    bson.decode_document(decipher, 0)[1],
                     ensure_ascii=False,
                     separators=(",", ":"),
                 ),
                 encoding="utf-8",
             )
         except Exception:
-            res = decipher[16:]
+            res = plain
         temp_path = (
             STORAGE_DIR
             / "asset"
@@ -218,7 +222,7 @@ class GameData(Task):
         )
 
         if temp_path.name.endswith(".lua.bytes"):
-            temp_path = temp_path.parent.joinpath(obj.m_Name)
+            temp_path = temp_path.parent.joinpath(script.name)
         elif temp_path.name.endswith(".bytes"):
             temp_path = temp_path.with_suffix(".json")
         else:
@@ -226,31 +230,18 @@ class GameData(Task):
 
         temp_path.parent.mkdir(parents=True, exist_ok=True)
 
-        try:
-            res = bytes(
-                json.dumps(
-                    bson.decode_document(decipher[16:], 0)[1],
-                    ensure_ascii=False,
-                    separators=(",", ":"),
-                ),
-                encoding="utf-8",
-            )
-        except Exception:
-            res = decipher[16:]
-
         return temp_path.write_bytes(res)
 
-    async def _unpack_gamedata(self, path: str, obj: TextAsset):
-        script: bytes = m_script_to_bytes(obj.m_Script)
+    async def _unpack_gamedata(self, path: str, script: RawScript):
         is_signed = self._check_signed(path)
         is_encrypted = self._check_encrypted(path)
         fb_name = await self._get_flatbuffer_name(path)
 
         if fb_name is not None:
-            return await self._decode_flatbuffer(path, obj, fb_name)
+            return await self._decode_flatbuffer(path, script, fb_name)
 
         if is_encrypted:
-            return await self._decrypt(path, obj, is_signed)
+            return await self._decrypt(path, script, is_signed)
 
         output_path = STORAGE_DIR.joinpath(
             "asset",
@@ -264,36 +255,32 @@ class GameData(Task):
             output_path = output_path.with_suffix(".json")
 
         try:
-            decoded_data = (
-                bson.decode_document(
-                    (
-                        bytes(script)[128:]
-                        if "buff_template_data" not in path
-                        else bytes(script)
-                    ),
-                    0,
-                )[1]
-                if "gamedata/levels" in path or "buff_template_data" in path
-                else json.loads(obj.m_Script)
-            )
-            pack_data = json.dumps(
+            if "gamedata/levels" in path or "buff_template_data" in path:
+                # bson needs bytes, the one copy made of the script
+                skip = 128 if "buff_template_data" not in path else 0
+                decoded_data = bson.decode_document(bytes(script.view(skip)), 0)[1]
+            else:
+                decoded_data = json.loads(
+                    str(script.view(), "utf-8", "surrogateescape")
+                )
+            pack_data: bytes | memoryview = json.dumps(
                 decoded_data,
                 ensure_ascii=False,
                 separators=(",", ":"),
-            )
+            ).encode("utf-8")
 
         except Exception:
-            pack_data = obj.m_Script
+            pack_data = script.view()
 
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(pack_data, encoding="utf-8")
+        output_path.write_bytes(pack_data)
 
     async def unpack(self, ab_path: str):
         real_path = await self.client.resolve(ab_path)
-        env = UnityPy.load(real_path)
-        for path, object in env.container.items():
-            if isinstance((asset := object.read()), TextAsset):
-                await self._unpack_gamedata(path, asset)
+        env = load_bundle(real_path)
+        for path, obj in env.container.items():
+            if obj.type.name == "TextAsset":
+                await self._unpack_gamedata(path, read_raw_script(obj))
 
     async def start(self):
         gamedata_abs = [
@@ -305,9 +292,26 @@ class GameData(Task):
         await asyncio.gather(*(self.client.resolve(ab) for ab in gamedata_abs))
         await asyncio.gather(*(self.unpack(ab) for ab in gamedata_abs))
 
+        res_version = self.client.version.res_version
+        if self.client.config.gamedata_store:
+            # the plain tree stays until a later version is stored
+            await run_sync(gamedata_store.ingest)(res_version, remove=False)
+
         if platform.system() != "Windows":
             STORAGE_DIR.joinpath("asset", "gamedata", "latest").unlink(True)
             STORAGE_DIR.joinpath("asset", "gamedata", "latest").symlink_to(
-                f"./{self.client.version.res_version}",
+                f"./{res_version}",
                 True,
             )
+
+        if self.client.config.gamedata_store:
+            await run_sync(gamedata_store.prune)(res_version)
+
+        if self.client.config.gamedata_sqlite:
+            excel_dir = STORAGE_DIR / "asset" / "gamedata" / res_version / "excel"
+            try:
+                await run_sync(export_tables)(
+                    excel_dir, GAMEDATA_SQLITE_DIR / f"{res_version}.sqlite"
+                )
+            except Exception as e:
+                logger.opt(exception=e).error("Failed to export gamedata to SQLite")
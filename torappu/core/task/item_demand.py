@@ -1,35 +1,127 @@
+import gzip
+import hashlib
 import itertools
 import json
-from typing import ClassVar
-
-from torappu.consts import BASE_DIR
+from collections.abc import Iterator
+from typing import Any, ClassVar
+
+import httpx
+import numpy as np
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from torappu import get_config
+from torappu.consts import BASE_DIR, STORAGE_DIR
+from torappu.core.utils import write_atomic
 from torappu.log import logger
 from torappu.models import Diff
 
 from .task import Task
 from .utils import trans_prof
 
+# columns of the summed costs; mastery takes one column per skill from here
+ELITE, SKILL, UNIEQUIP, MASTERY = range(4)
+SOURCE_TABLES = {"character_table", "char_patch_table", "item_table", "uniequip_table"}
+
+# the body of the last successful upload
+LAST_UPLOAD_PATH = STORAGE_DIR / "item_demand" / "last_upload.json"
+UPLOAD_ATTEMPTS = 5
+# answers to a delta upload that call for the full demand instead
+DELTA_REJECTED = {404, 405, 409, 422}
+
+config = get_config()
+
+
+def cost_records(
+    character_table: dict[str, Any], uniequip_table: dict[str, Any]
+) -> Iterator[tuple[str, str, int, int]]:
+    """Flatten every upgrade cost into (item id, char id, column, count)"""
+    for char_id, char_detail in character_table.items():
+        if char_detail["profession"] in ("TRAP", "TOKEN"):
+            continue
+
+        # promoting the second form of Amiya costs nothing on its own, but
+        # still lists the items
+        free = char_id == "char_1001_amiya2"
+        for phase in char_detail["phases"]:
+            for cost in phase["evolveCost"] or []:
+                yield cost["id"], char_id, ELITE, 0 if free else cost["count"]
+
+        if not char_detail["skills"]:
+            continue
+
+        for skill_level_up in char_detail["allSkillLvlup"]:
+            for cost in skill_level_up["lvlUpCost"] or []:
+                yield cost["id"], char_id, SKILL, cost["count"]
+
+        masteries = (
+            skill for skill in char_detail["skills"] if skill["levelUpCostCond"]
+        )
+        for i, skill in enumerate(masteries):
+            for cost_cond in skill["levelUpCostCond"]:
+                for cost in cost_cond["levelUpCost"] or []:
+                    yield cost["id"], char_id, MASTERY + i, cost["count"]
+
+    for uniequip_detail in uniequip_table["equipDict"].values():
+        if not uniequip_detail["itemCost"]:
+            continue
+        for cost in itertools.chain.from_iterable(uniequip_detail["itemCost"].values()):
+            if cost["type"] == "MATERIAL":
+                yield cost["id"], uniequip_detail["charId"], UNIEQUIP, cost["count"]
+
+
+def dump_demand(demand: dict[str, Any]) -> bytes:
+    """Canonical JSON of `demand`, so equal results give equal bytes"""
+    return json.dumps(
+        demand, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+def demand_delta(last: dict[str, Any], demand: dict[str, Any]) -> dict[str, Any]:
+    """Items of `demand` that differ from `last`, and the ones it dropped"""
+    return {
+        "changed": {k: v for k, v in demand.items() if last.get(k) != v},
+        "removed": [k for k in last if k not in demand],
+    }
+
+
+def compress(body: bytes, encoding: str) -> tuple[bytes, str]:
+    """Compress `body` for a Content-Encoding of `encoding`"""
+    if encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning("zstandard is not installed, uploading with gzip")
+        else:
+            return zstandard.ZstdCompressor().compress(body), "zstd"
+        encoding = "gzip"
+    if encoding == "gzip":
+        return gzip.compress(body), "gzip"
 
-def ensure_item_exists(item_demand, item_name, char_id, char_detail, skill_num):
-    if not item_demand.get(item_name):
-        item_demand[item_name] = {}
-    if not item_demand[item_name].get(char_id):
-        item_demand[item_name][char_id] = {
-            "rarity": int(char_detail["rarity"].replace("TIER_", "")),
-            "name": char_detail["name"],
-            "profession": char_detail["profession"],
-            "elite": 0,
-            "skill": 0,
-            "uniequip": 0,
-            "mastery": [0 for i in range(0, skill_num)],
-        }
+    return body, "identity"
+
+
+def is_transient(e: BaseException) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
 
 
 class ItemDemand(Task):
     priority: ClassVar[int] = 1
 
     def check(self, diff_list: list[Diff]) -> bool:
-        return True
+        diff_set = {diff.path for diff in diff_list}
+        return any(
+            bundle in diff_set
+            for asset, bundle in self.client.asset_to_bundle.items()
+            if asset.startswith("gamedata/excel/")
+            and asset.rsplit("/", 1)[-1].split(".")[0] in SOURCE_TABLES
+        )
 
     async def start(self):
         demand = self.get_item_demand()
@@ -38,16 +130,65 @@ class ItemDemand(Task):
             return
 
         if self.client.config.backend_endpoint:
-            logger.debug("uploading item demand json")
-            await self.client.http_client.post(
-                self.client.config.backend_endpoint + "/api/v1/item/demand",
-                headers={"torappu-auth": self.client.config.token},
-                json=demand,
-            )
+            await self.upload(demand)
         else:
             dest = BASE_DIR / "itemDemand.json"
             dest.write_text(json.dumps(demand, ensure_ascii=False), encoding="utf-8")
 
+    async def upload(self, demand: dict[str, Any]):
+        body = dump_demand(demand)
+        last = LAST_UPLOAD_PATH.read_bytes() if LAST_UPLOAD_PATH.is_file() else None
+        if last == body:
+            logger.info("item demand unchanged since the last upload, skipping")
+            return
+
+        endpoint = f"{self.client.config.backend_endpoint}/api/v1/item/demand"
+        uploaded = False
+        if config.upload_delta and last is not None:
+            logger.debug("uploading item demand delta")
+            delta = {
+                "base": hashlib.sha256(last).hexdigest(),
+                **demand_delta(json.loads(last), demand),
+            }
+            try:
+                await self.post(f"{endpoint}/delta", dump_demand(delta))
+                uploaded = True
+            except httpx.HTTPStatusError as e:
+                # unsupported, or the server missed our previous upload
+                if e.response.status_code not in DELTA_REJECTED:
+                    raise
+                logger.info("item demand delta rejected, uploading it in full")
+
+        if not uploaded:
+            logger.debug("uploading item demand json")
+            await self.post(endpoint, body)
+
+        write_atomic(LAST_UPLOAD_PATH, body)
+
+    @retry(
+        stop=stop_after_attempt(UPLOAD_ATTEMPTS),
+        wait=wait_random_exponential(multiplier=1, max=30),
+        retry=retry_if_exception(is_transient),
+        reraise=True,
+    )
+    async def post(self, url: str, body: bytes):
+        content, encoding = compress(body, config.upload_encoding)
+        headers = {
+            "torappu-auth": self.client.config.token or "",
+            "content-type": "application/json",
+        }
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+        response = await self.client.http_client.post(
+            url, headers=headers, content=content
+        )
+        if response.status_code == 415 and encoding != "identity":
+            logger.warning(f"{url} does not accept {encoding} bodies")
+            response = await self.client.http_client.post(
+                url, headers={**headers, "content-encoding": "identity"}, content=body
+            )
+        response.raise_for_status()
+
     def get_item_demand(self):
         character_table = self.get_gamedata("excel/character_table.json")
         item_table = self.get_gamedata("excel/item_table.json")
@@ -60,101 +201,52 @@ class ItemDemand(Task):
             )
             character_table[patch_char_id] = patch_char_detail
 
-        item_demand = {}
-        for char_id, char_detail in character_table.items():
-            if (
-                char_detail["profession"] == "TRAP"
-                or char_detail["profession"] == "TOKEN"
-            ):
-                continue
-
-            for phase in char_detail["phases"]:
-                if phase["evolveCost"]:
-                    for evolve_cost_item in phase["evolveCost"]:
-                        item_name = item_table["items"][evolve_cost_item["id"]]["name"]
-                        ensure_item_exists(
-                            item_demand,
-                            item_name,
-                            char_id,
-                            char_detail,
-                            len(char_detail.get("skills", [{}, {}, {}])),
-                        )
-                        if char_id == "char_1001_amiya2":
-                            item_demand[item_name][char_id]["elite"] = 0
-                            continue
-                        item_demand[item_name][char_id]["elite"] += evolve_cost_item[
-                            "count"
-                        ]
-
-            if not char_detail["skills"]:
-                continue
-
-            for skill_level_up in char_detail["allSkillLvlup"]:
-                if not skill_level_up["lvlUpCost"]:
-                    continue
-                for demand in skill_level_up["lvlUpCost"]:
-                    item_name = item_table["items"][demand["id"]]["name"]
-                    ensure_item_exists(
-                        item_demand,
-                        item_name,
-                        char_id,
-                        char_detail,
-                        len(char_detail["skills"]),
-                    )
-                    item_demand[item_name][char_id]["skill"] += demand["count"]
-
-            i = 0
-            for skill in char_detail["skills"]:
-                if not skill["levelUpCostCond"]:
-                    continue
-                for cost_cond in skill["levelUpCostCond"]:
-                    if not cost_cond["levelUpCost"]:
-                        continue
-                    for demand in cost_cond["levelUpCost"]:
-                        item_name = item_table["items"][demand["id"]]["name"]
-                        ensure_item_exists(
-                            item_demand,
-                            item_name,
-                            char_id,
-                            char_detail,
-                            len(char_detail["skills"]),
-                        )
-                        item_demand[item_name][char_id]["mastery"][i] += demand["count"]
-                i += 1
-
-        for uniequip_id, uniequip_detail in uniequip_table["equipDict"].items():
-            if not uniequip_detail["itemCost"]:
-                continue
-            item_costs = list(
-                itertools.chain.from_iterable(uniequip_detail["itemCost"].values())
-            )
-            for demand in item_costs:
-                item_name = item_table["items"][demand["id"]]["name"]
-                char_id = uniequip_detail["charId"]
-                if demand["type"] != "MATERIAL":
-                    continue
-                ensure_item_exists(
-                    item_demand,
-                    item_name,
-                    char_id,
-                    character_table[char_id],
-                    len(character_table[char_id].get("skills", [])),
+        records = list(cost_records(character_table, uniequip_table))
+        if not records:
+            return {}
+
+        item_ids, char_ids, columns, counts = zip(*records)
+        # one row per (item name, char id), in order of first appearance
+        rows: dict[tuple[str, str], int] = {}
+        row_ids = np.fromiter(
+            (
+                rows.setdefault(
+                    (item_table["items"][item_id]["name"], char_id), len(rows)
                 )
-                item_demand[item_name][char_id]["uniequip"] += demand["count"]
-
-        delete_demand = []
-        for item_name, demand_detail in item_demand.items():
-            for char_id, char_demand in demand_detail.items():
-                if (
-                    char_demand["elite"] == 0
-                    and char_demand["skill"] == 0
-                    and set(char_demand["mastery"]) == {0}
-                    and char_demand["uniequip"] == 0
-                ):
-                    delete_demand.append((item_name, char_id))
-
-        for delete_target in delete_demand:
-            item_name, char_id = delete_target
-            del item_demand[item_name][char_id]
+                for item_id, char_id in zip(item_ids, char_ids)
+            ),
+            np.intp,
+            len(records),
+        )
+        width = max(MASTERY, *columns) + 1
+        totals = (
+            np.bincount(
+                row_ids * width + np.array(columns, np.intp),
+                weights=np.array(counts, np.float64),
+                minlength=len(rows) * width,
+            )
+            .astype(np.int64)
+            .reshape(len(rows), width)
+        )
+
+        item_demand: dict[str, dict[str, dict[str, Any]]] = {}
+        for (item_name, char_id), row in zip(rows, totals.tolist()):
+            # items stay listed even when no character needs them
+            demand = item_demand.setdefault(item_name, {})
+            char_detail = character_table[char_id]
+            skills = len(char_detail.get("skills") or [])
+            # characters without skills are kept even when they need nothing
+            if skills and not any(row):
+                continue
+            mastery = row[MASTERY : MASTERY + skills]
+            demand[char_id] = {
+                "rarity": int(char_detail["rarity"].replace("TIER_", "")),
+                "name": char_detail["name"],
+                "profession": char_detail["profession"],
+                "elite": row[ELITE],
+                "skill": row[SKILL],
+                "uniequip": row[UNIEQUIP],
+                "mastery": mastery + [0] * (skills - len(mastery)),
+            }
 
         return item_demand
@@ -1,13 +1,15 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
-from PIL import Image
 from UnityPy.classes import Sprite
 
 from torappu.consts import ASSETS_DIR, STORAGE_DIR
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
+from torappu.core.output import save_image
 from torappu.core.task.utils import read_obj
+from torappu.core.texture import image_cache
+from torappu.core.utils import run_sync
 from torappu.models import Diff
 
 from .task import Task
@@ -33,7 +35,12 @@ class ItemIcon(Task):
     def __init__(self, client: Client) -> None:
         super().__init__(client)
 
-        item_table = self.get_gamedata("excel/item_table.json")
+        item_table = self.get_gamedata_fields(
+            "excel/item_table.json",
+            "items.*.iconId",
+            "items.*.rarity",
+            "items.*.itemType",
+        )
         self.dict_rarity_bg = {
             item["iconId"]: ITEM_BACKGROUND_IMAGES[item["rarity"]]
             for item in item_table["items"].values()
@@ -44,36 +51,37 @@ class ItemIcon(Task):
             if item["itemType"] in SKIP_BG_TYPES
         }
 
-    async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+    @run_sync
+    def unpack(self, ab_path: str):
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if (texture := read_obj(Sprite, obj)) is None:
                 continue
+            # Sprite.image crops the atlas again on every access
+            image = texture.image
             if texture.m_Name in self.skip_bg_items:
-                texture.image.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+                save_image(
+                    image, BASE_DIR.joinpath(f"{texture.m_Name}.png"), thumbnails=True
+                )
                 continue
-            texture.image.save(RAW_DIR.joinpath(f"{texture.m_Name}.png"))
+            save_image(image, RAW_DIR.joinpath(f"{texture.m_Name}.png"))
 
             bg_path = self.dict_rarity_bg.get(texture.m_Name)
             if not bg_path:
                 continue
 
-            bg = Image.open(bg_path)
+            bg = image_cache.get(bg_path).copy()
             bg_width, bg_height = bg.size
             rect_offset = texture.m_RD.textureRectOffset
             position = (
                 round((bg_width - texture.m_Rect.width) / 2 + rect_offset.x),
                 bg_height
-                - texture.image.height
+                - image.height
                 - round((bg_height - texture.m_Rect.height) / 2 + rect_offset.y),
             )
-            bg.paste(
-                texture.image,
-                position,
-                texture.image,
-            )
+            bg.paste(image, position, image)
 
-            bg.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+            save_image(bg, BASE_DIR.joinpath(f"{texture.m_Name}.png"), thumbnails=True)
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
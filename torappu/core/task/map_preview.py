@@ -1,12 +1,12 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
 from torappu.core.client import Client
-from torappu.core.task.utils import read_obj
+from torappu.core.output import save_image
+from torappu.core.task.utils import load_objects
 from torappu.core.utils import run_sync
 from torappu.models import Diff
 
@@ -17,30 +17,26 @@ BASE_DIR = STORAGE_DIR.joinpath("asset", "raw", "map_preview")
 
 @run_sync
 def unpack_sandbox(ab_path: str):
-    env = UnityPy.load(ab_path)
-    for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
-        if texture := read_obj(Sprite, obj):
-            texture.image.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+    for _, texture in load_objects(ab_path, Sprite):
+        save_image(
+            texture.image, BASE_DIR.joinpath(f"{texture.m_Name}.png"), thumbnails=True
+        )
 
 
 @run_sync
 def unpack_universal(ab_path: str):
-    env = UnityPy.load(ab_path)
-    for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
-        if texture := read_obj(Sprite, obj):
-            resized = texture.image.resize((1280, 720))
-            resized.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+    for _, texture in load_objects(ab_path, Sprite):
+        resized = texture.image.resize((1280, 720))
+        save_image(resized, BASE_DIR.joinpath(f"{texture.m_Name}.png"), thumbnails=True)
 
 
 @run_sync
 def unpack_big(ab_path: str):
-    env = UnityPy.load(ab_path)
-    for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
-        if texture := read_obj(Sprite, obj):
-            if not texture.m_Name.endswith("_preview"):
-                continue
-            resized = texture.image.resize((1280, 720))
-            resized.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+    for _, texture in load_objects(ab_path, Sprite):
+        if not texture.m_Name.endswith("_preview"):
+            continue
+        resized = texture.image.resize((1280, 720))
+        save_image(resized, BASE_DIR.joinpath(f"{texture.m_Name}.png"), thumbnails=True)
 
 
 class MapPreview(Task):
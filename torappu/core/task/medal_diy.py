@@ -2,13 +2,15 @@ from dataclasses import dataclass
 from typing import ClassVar, cast
 
 import anyio
-import UnityPy
 from PIL import Image
 from UnityPy.classes import MonoBehaviour, Sprite
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
+from torappu.core.output import save_image
 from torappu.core.task.utils import read_obj
+from torappu.core.texture import image_cache
 from torappu.core.utils import run_async, run_sync
 from torappu.models import Diff
 
@@ -44,7 +46,7 @@ class MedalDIY(Task):
 
     @run_sync
     def unpack_metadata(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        env = load_bundle(ab_path)
         run_async(self.load_anon)(env)
 
         for obj in filter(lambda obj: obj.type.name == "MonoBehaviour", env.objects):
@@ -63,7 +65,7 @@ class MedalDIY(Task):
         result = bg.copy()
         for medal_pos in pos_list:
             medal_image_path = MEDAL_ICON_DIR / f"{medal_pos.medalId}.png"
-            medal_image = Image.open(medal_image_path)
+            medal_image = image_cache.get(medal_image_path)
 
             # flip the y axis, pillow uses bottom-right as origin
             result.paste(
@@ -78,36 +80,40 @@ class MedalDIY(Task):
 
     @run_sync
     def unpack_ab(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if (texture := read_obj(Sprite, obj)) is None:
                 continue
             background_image = texture.image
-            background_image.save(BKG_DIR / f"{texture.m_Name}.png")
+            save_image(background_image, BKG_DIR / f"{texture.m_Name}.png")
 
             medal_pos_list = self.dict_medal_pos.get(texture.m_Name, None)
             if medal_pos_list is None:
                 continue
 
             resized = background_image.resize((1374, 459))
-            self.build_up(medal_pos_list, resized).save(
-                BASE_DIR / f"{texture.m_Name}.png"
+            save_image(
+                self.build_up(medal_pos_list, resized),
+                BASE_DIR / f"{texture.m_Name}.png",
             )
             if any(medal.medalId in self.dict_advanced for medal in medal_pos_list):
-                self.build_up(
-                    [
-                        MedalPosition(
-                            (
-                                self.dict_advanced[medal.medalId]
-                                if medal.medalId in self.dict_advanced
-                                else medal.medalId
-                            ),
-                            medal.pos,
-                        )
-                        for medal in medal_pos_list
-                    ],
-                    resized,
-                ).save(TRIM_DIR / f"{texture.m_Name}.png")
+                save_image(
+                    self.build_up(
+                        [
+                            MedalPosition(
+                                (
+                                    self.dict_advanced[medal.medalId]
+                                    if medal.medalId in self.dict_advanced
+                                    else medal.medalId
+                                ),
+                                medal.pos,
+                            )
+                            for medal in medal_pos_list
+                        ],
+                        resized,
+                    ),
+                    TRIM_DIR / f"{texture.m_Name}.png",
+                )
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
@@ -142,7 +148,11 @@ class MedalDIY(Task):
         BASE_DIR.mkdir(parents=True, exist_ok=True)
         BKG_DIR.mkdir(exist_ok=True)
         TRIM_DIR.mkdir(exist_ok=True)
-        icon_data = self.get_gamedata("excel/medal_table.json")
+        icon_data = self.get_gamedata_fields(
+            "excel/medal_table.json",
+            "medalList[].medalId",
+            "medalList[].advancedMedal",
+        )
         self.dict_advanced = {
             medal["medalId"]: medal["advancedMedal"]
             for medal in icon_data["medalList"]
@@ -1,10 +1,11 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
+from torappu.core.output import save_image_async
 from torappu.core.task.utils import read_obj
 from torappu.models import Diff
 
@@ -17,10 +18,12 @@ class MedalIcon(Task):
     priority: ClassVar[int] = 4
 
     async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if texture := read_obj(Sprite, obj):
-                texture.image.save(BASE_DIR.joinpath(f"{texture.m_Name}.png"))
+                await save_image_async(
+                    texture.image, BASE_DIR.joinpath(f"{texture.m_Name}.png")
+                )
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
@@ -1,12 +1,12 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
 from torappu.core.client import Client
-from torappu.core.task.utils import build_container_path, read_obj
+from torappu.core.output import save_image_async
+from torappu.core.task.utils import load_objects
 from torappu.models import Diff
 
 from .task import Task
@@ -22,42 +22,35 @@ class MixStory(Task):
         self.ab_list: set[str] = set()
 
     async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
-        container_map = build_container_path(env)
-        for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
-            if texture := read_obj(Sprite, obj):
-                if texture.object_reader is None:
-                    continue
-                container_path = container_map[texture.object_reader.path_id]
+        for container_path, texture in load_objects(
+            ab_path, Sprite, "dyn/arts/ui/mixstory/"
+        ):
+            # Map source directories to target directories
+            if container_path.startswith("dyn/arts/ui/mixstory/abbrs/"):
+                target_path = container_path.replace(
+                    "dyn/arts/ui/mixstory/abbrs/", "abbr/"
+                )
+            elif container_path.startswith("dyn/arts/ui/mixstory/splits/"):
+                target_path = container_path.replace(
+                    "dyn/arts/ui/mixstory/splits/", "deco/"
+                )
+            elif container_path.startswith("dyn/arts/ui/mixstory/decos/"):
+                target_path = container_path.replace(
+                    "dyn/arts/ui/mixstory/decos/", "deco/"
+                )
+            elif container_path.startswith("dyn/arts/ui/mixstory/kvs/"):
+                target_path = container_path.replace("dyn/arts/ui/mixstory/kvs/", "kv/")
+            elif container_path.startswith("dyn/arts/ui/mixstory/titles/"):
+                target_path = container_path.replace(
+                    "dyn/arts/ui/mixstory/titles/", "title/"
+                )
+            else:
+                # Skip if it doesn't match any expected path
+                continue
 
-                # Map source directories to target directories
-                if container_path.startswith("dyn/arts/ui/mixstory/abbrs/"):
-                    target_path = container_path.replace(
-                        "dyn/arts/ui/mixstory/abbrs/", "abbr/"
-                    )
-                elif container_path.startswith("dyn/arts/ui/mixstory/splits/"):
-                    target_path = container_path.replace(
-                        "dyn/arts/ui/mixstory/splits/", "deco/"
-                    )
-                elif container_path.startswith("dyn/arts/ui/mixstory/decos/"):
-                    target_path = container_path.replace(
-                        "dyn/arts/ui/mixstory/decos/", "deco/"
-                    )
-                elif container_path.startswith("dyn/arts/ui/mixstory/kvs/"):
-                    target_path = container_path.replace(
-                        "dyn/arts/ui/mixstory/kvs/", "kv/"
-                    )
-                elif container_path.startswith("dyn/arts/ui/mixstory/titles/"):
-                    target_path = container_path.replace(
-                        "dyn/arts/ui/mixstory/titles/", "title/"
-                    )
-                else:
-                    # Skip if it doesn't match any expected path
-                    continue
-
-                path = BASE_DIR.joinpath(target_path)
-                path.parent.mkdir(parents=True, exist_ok=True)
-                texture.image.save(path)
+            path = BASE_DIR.joinpath(target_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            await save_image_async(texture.image, path)
 
     def check(self, diff_list: list[Diff]) -> bool:
         diff_set = {diff.path for diff in diff_list}
@@ -1,11 +1,11 @@
 from typing import ClassVar
 
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
 from torappu.core.client import Client
-from torappu.core.task.utils import read_obj
+from torappu.core.output import save_image_async
+from torappu.core.task.utils import load_objects
 from torappu.models import Diff
 
 from .task import Task
@@ -31,14 +31,12 @@ class Skill(Task):
 
         return len(self.ab_list) > 0
 
-    def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
-        for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
-            if data := read_obj(Sprite, obj):
-                data.image.save(BASE_PATH / f"{data.m_Name}.png")
+    async def unpack(self, ab_path: str):
+        for _, data in load_objects(ab_path, Sprite):
+            await save_image_async(data.image, BASE_PATH / f"{data.m_Name}.png")
 
     async def start(self):
         paths = await self.client.resolves(list(self.ab_list))
         BASE_PATH.mkdir(parents=True, exist_ok=True)
         for _, ab_path in paths:
-            self.unpack(ab_path)
+            await self.unpack(ab_path)
@@ -5,8 +5,11 @@ from typing import ClassVar
 
 from UnityPy import Environment
 
-from torappu.consts import GAMEDATA_DIR
+from torappu.core import gamedata_store
+from torappu.core.bundle import dependency_cache
 from torappu.core.client import Client
+from torappu.core.output import encode_batch, wait_encoded
+from torappu.core.projection import load_projected
 from torappu.log import logger
 from torappu.models import Diff
 
@@ -29,7 +32,9 @@ class Task(abc.ABC):
 
     async def run(self):
         logger.info(f"Starting task {type(self).__name__}")
-        await self.start()
+        with encode_batch():
+            await self.start()
+            await wait_encoded()
         logger.info(f"Finished task {type(self).__name__}")
 
     @abc.abstractmethod
@@ -37,13 +42,19 @@ class Task(abc.ABC):
         raise NotImplementedError
 
     def get_gamedata(self, path: str):
-        json_path = GAMEDATA_DIR.joinpath(self.client.version.res_version, path)
-        return json.loads(json_path.read_text("utf-8"))
+        return json.loads(gamedata_store.read(self.client.version.res_version, path))
 
-    async def load_anon(self, env: Environment):
-        paths = [
+    def get_gamedata_fields(self, path: str, *fields: str):
+        """Load only `fields` of a gamedata table, see `torappu.core.projection`"""
+        data = gamedata_store.read(self.client.version.res_version, path)
+        return load_projected(data, *fields)
+
+    async def anon_paths(self) -> list[str]:
+        return [
             *await self.client.resolve_by_prefix("anon/"),
             *await self.client.resolve_by_prefix("refs/"),
         ]
-        for path in paths:
-            env.load_file(path, is_dependency=True)
+
+    async def load_anon(self, env: Environment):
+        for path in await self.anon_paths():
+            dependency_cache.attach(env, path)
@@ -1,11 +1,12 @@
 from typing import ClassVar
 
 import anyio
-import UnityPy
 from UnityPy.classes import Sprite
 
 from torappu.consts import STORAGE_DIR
+from torappu.core.bundle import load_bundle
 from torappu.core.client import Client
+from torappu.core.output import save_image_async
 from torappu.core.task.utils import read_obj
 from torappu.models import Diff
 
@@ -23,15 +24,16 @@ class UniEquipDirection(Task):
         self.hub_config: dict[str, str] = {}
 
     async def unpack(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "Sprite", env.objects):
             if texture := read_obj(Sprite, obj):
-                texture.image.save(
-                    BASE_DIR.joinpath(f"{self.hub_config[texture.m_Name]}.png")
+                await save_image_async(
+                    texture.image,
+                    BASE_DIR.joinpath(f"{self.hub_config[texture.m_Name]}.png"),
                 )
 
     async def unpack_hub(self, ab_path: str):
-        env = UnityPy.load(ab_path)
+        env = load_bundle(ab_path)
         for obj in filter(lambda obj: obj.type.name == "MonoBehaviour", env.objects):
             behaviour = obj.read_typetree()  # type: ignore
             # values: Arts/UI/UniEquipDirection/spc-y
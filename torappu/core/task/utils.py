@@ -1,12 +1,30 @@
-from typing import TypeVar
+from collections import Counter
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from struct import Struct
+from typing import Literal, TypeVar, cast
 
 import numpy as np
 from PIL import Image
 from UnityPy import Environment
-from UnityPy.classes import FastPropertyName, Material, Texture2D, UnityTexEnv
+from UnityPy.classes import (
+    FastPropertyName,
+    Material,
+    PPtr,
+    TextAsset,
+    Texture2D,
+    UnityTexEnv,
+)
+from UnityPy.enums import ClassIDType
 from UnityPy.files.ObjectReader import ObjectReader
 
-from torappu.consts import PROFESSIONS
+from torappu.consts import BUNDLE_INDEX_DIR, PROFESSIONS
+from torappu.core import imageops
+from torappu.core.bundle import load_bundle, reader_lock
+from torappu.core.texture import decode_texture
+from torappu.core.utils import write_atomic
+from torappu.models import BundleIndex
 
 T = TypeVar("T")
 
@@ -30,11 +48,9 @@ def apply_premultiplied_alpha(rgba: "Image.Image"):
     :returns: A new image instance;
     :rtype: Image;
     """
-    img_rgba: Image.Image = rgba.convert("RGBA")
-    data = np.array(img_rgba, dtype=np.float32)
-    data[:, :, :3] *= data[:, :, 3:] / 255.0
-    data_int = np.clip(data, 0, 255).astype(np.uint8)
-    return Image.fromarray(data_int, "RGBA")
+    img_rgba = rgba if rgba.mode == "RGBA" else rgba.convert("RGBA")
+    # np.array copies, so cached images passed in stay untouched
+    return Image.fromarray(imageops.premultiply(np.array(img_rgba)), "RGBA")
 
 
 def merge_alpha(alpha_texture: Texture2D | None, rgb_texture: Texture2D | None):
@@ -42,20 +58,58 @@ def merge_alpha(alpha_texture: Texture2D | None, rgb_texture: Texture2D | None):
         raise Exception("rgb texture not found")
 
     if alpha_texture is None:
-        return (apply_premultiplied_alpha(rgb_texture.image), rgb_texture.m_Name)
-
-    r, g, b = rgb_texture.image.split()[:3]
-    if (
-        alpha_texture.m_Width != rgb_texture.m_Width
-        or alpha_texture.m_Height != rgb_texture.m_Height
-    ):
-        (a, *_) = alpha_texture.image.resize(
-            (rgb_texture.m_Width, rgb_texture.m_Height)
-        ).split()
+        return (
+            apply_premultiplied_alpha(decode_texture(rgb_texture)),
+            rgb_texture.m_Name,
+        )
+
+    rgb_image = decode_texture(rgb_texture)
+    alpha_image = decode_texture(alpha_texture)
+    if alpha_image.size != rgb_image.size:
+        alpha_image = alpha_image.resize(rgb_image.size)
+
+    # decoded textures are cached, so the alpha goes into a copy
+    if rgb_image.mode == "RGBA":
+        merged = rgb_image.copy()
+    else:
+        merged = rgb_image.convert("RGBA")
+    merged.putalpha(alpha_image.getchannel(0))
+    return merged, rgb_texture.m_Name
+
+
+def trim_bounds(
+    image: "Image.Image | np.ndarray",
+    tolerance: int = 0,
+    axes: Literal["x", "y", "xy"] = "xy",
+    background: Sequence[int] | int | None = None,
+) -> tuple[int, int, int, int] | None:
+    """Find the box around everything that is not background.
+
+    A pixel is background when no channel differs from `background` (the
+    top-left pixel by default) by more than `tolerance`. Only the edges along
+    `axes` are trimmed, the box spans the whole image on the other axis.
+
+    :returns: (left, upper, right, lower) for `Image.crop`, or `None` if the
+        whole image is background;
+    """
+    data = np.asarray(image)
+    if data.ndim == 2:
+        data = data[..., None]
+    height, width = data.shape[:2]
+    if background is None:
+        reference = data[0, 0].astype(np.int16)
     else:
-        a, *_ = alpha_texture.image.split()
+        reference = np.asarray(background, np.int16).reshape(-1)
 
-    return Image.merge("RGBA", (r, g, b, a)), rgb_texture.m_Name
+    content = (np.abs(data.astype(np.int16) - reference) > tolerance).any(axis=2)
+    rows = np.flatnonzero(content.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(content.any(axis=0))
+
+    left, right = (columns[0], columns[-1] + 1) if "x" in axes else (0, width)
+    upper, lower = (rows[0], rows[-1] + 1) if "y" in axes else (0, height)
+    return int(left), int(upper), int(right), int(lower)
 
 
 def material2img(mat: Material):
@@ -90,11 +144,202 @@ def build_container_path(env: Environment) -> dict[int, str]:
     return container_map
 
 
+def read_script_pptr(obj: ObjectReader) -> PPtr:
+    """Read only m_Script of the MonoBehaviour `obj`.
+
+    It follows m_GameObject and m_Enabled, the fields every MonoBehaviour
+    starts with, so the rest of the object is never parsed.
+    """
+    reader = obj.reader
+    wide = obj.assets_file.header.version >= 14
+    with reader_lock(obj):
+        position = reader.Position
+        obj.reset()
+        try:
+            reader.read_int()
+            reader.read_long() if wide else reader.read_int()
+            reader.read_u_byte()
+            reader.align_stream()
+            file_id = reader.read_int()
+            path_id = reader.read_long() if wide else reader.read_int()
+        finally:
+            reader.Position = position
+
+    return PPtr(m_FileID=file_id, m_PathID=path_id, assetsfile=obj.assets_file)
+
+
+def build_script_names(env: Environment) -> dict[int, str | None]:
+    """Map MonoBehaviour path ids to their script names.
+
+    A script that cannot be resolved is mapped to `None`, so callers read
+    that MonoBehaviour to find out.
+    """
+    scripts: dict[int, str | None] = {}
+    names: dict[tuple[int, int], str | None] = {}
+    for obj in filter(lambda obj: obj.type.name == "MonoBehaviour", env.objects):
+        try:
+            pptr = read_script_pptr(obj)
+        except Exception:
+            scripts[obj.path_id] = None
+            continue
+        key = (pptr.m_FileID, pptr.m_PathID)
+        if key not in names:
+            try:
+                script = pptr.deref()
+                names[key] = script.peek_name() or script.read().m_Name
+            except Exception:
+                names[key] = None
+        scripts[obj.path_id] = names[key]
+
+    return scripts
+
+
+def script_may_be(
+    scripts: dict[int, str | None] | None, path_id: int, name: str
+) -> bool:
+    """Check whether the MonoBehaviour `path_id` may run the script `name`.
+
+    Only a script name resolved to another one in `scripts` rules it out.
+    """
+    if scripts is None or (script := scripts.get(path_id)) is None:
+        return True
+
+    return script == name
+
+
+def has_dependencies(env: Environment) -> bool:
+    return any(getattr(f, "is_dependency", False) for f in env.files.values())
+
+
+def build_bundle_index(env: Environment, scripts: bool = False) -> BundleIndex:
+    return BundleIndex(
+        container=build_container_path(env),
+        classes=Counter(obj.type.name for obj in env.objects),
+        scripts=build_script_names(env) if scripts else None,
+    )
+
+
+def load_bundle_index(path: str) -> BundleIndex | None:
+    index_path = BUNDLE_INDEX_DIR / f"{Path(path).name}.json"
+    if not index_path.is_file():
+        return None
+
+    return BundleIndex.model_validate_json(index_path.read_bytes())
+
+
+def get_bundle_index(
+    path: str, env: Environment | None = None, scripts: bool = False
+) -> BundleIndex:
+    """Get the index of the bundle at `path`, keyed by its file name (the md5).
+
+    The index is built from `env` (or a fresh environment) on first use and
+    stored under `BUNDLE_INDEX_DIR`, so later runs skip the typetree parsing.
+    MonoBehaviour script names are only resolved for callers asking for
+    `scripts` that pass an `env` with dependencies attached; an index without
+    them is rebuilt once such a caller comes.
+    """
+    scripts = scripts and env is not None and has_dependencies(env)
+    index = load_bundle_index(path)
+    if index is not None and (not scripts or index.scripts is not None):
+        return index
+
+    index = build_bundle_index(env or load_bundle(path), scripts)
+    write_atomic(BUNDLE_INDEX_DIR / f"{Path(path).name}.json", index.model_dump_json())
+
+    return index
+
+
+def bundle_may_contain(path: str, klass: str, script: str | None = None) -> bool:
+    """Check the stored index of a bundle for objects of `klass`.
+
+    `script` additionally narrows MonoBehaviours down by their script name;
+    one whose script was not resolved may be any. Bundles without an index
+    yet may contain anything.
+    """
+    index = load_bundle_index(path)
+    if index is None:
+        return True
+    if script is not None and index.scripts is not None:
+        names = set(index.scripts.values())
+        return script in names or None in names
+
+    return index.classes.get(klass, 0) > 0
+
+
+def load_objects(
+    path: str, klass: type[T], prefix: str | None = None
+) -> Iterator[tuple[str, T]]:
+    """Lazily read the objects of `klass` from the bundle at `path`.
+
+    Only object headers are parsed when the bundle is opened; objects are
+    matched by class id (and container path when `prefix` is given) and
+    decoded one by one as the iterator advances.
+
+    :returns: pairs of container path (empty if unknown) and object;
+    """
+    if not bundle_may_contain(path, klass.__name__):
+        return
+
+    env = load_bundle(path)
+    container = get_bundle_index(path, env).container
+    class_id = ClassIDType[klass.__name__]
+    for obj in env.objects:
+        if obj.type != class_id:
+            continue
+        container_path = container.get(obj.path_id, "")
+        if prefix is not None and not container_path.startswith(prefix):
+            continue
+
+        yield container_path, cast("T", obj.read())
+
+
 def m_script_to_bytes(script: str) -> bytes:
     """Convert m_Script to bytes"""
     return script.encode("utf-8", "surrogateescape")
 
 
+@dataclass
+class RawScript:
+    """m_Script of a TextAsset, as a range of the raw data of the object.
+
+    The raw data is the one copy of the object's bytes that
+    `ObjectReader.get_raw_data` reads out of the decompressed bundle; the
+    script is only sliced from it, never copied again.
+    """
+
+    name: str
+    data: bytes | memoryview
+    start: int
+    end: int
+
+    def view(self, skip: int = 0) -> memoryview:
+        return memoryview(self.data)[self.start + skip : self.end]
+
+
+def read_raw_script(obj: ObjectReader) -> RawScript:
+    """Read a TextAsset without decoding m_Script to str and encoding it back.
+
+    Falls back to the type tree when the raw data is not laid out as
+    m_Name followed by m_Script.
+    """
+    data = obj.get_raw_data()
+    length = Struct(obj.reader.endian + "i")
+    if len(data) >= 4:
+        (name_size,) = length.unpack_from(data, 0)
+        start = 4 + name_size + (-name_size % 4)
+        if 0 <= name_size and start + 4 <= len(data):
+            (size,) = length.unpack_from(data, start)
+            end = start + 4 + size
+            # m_Script is the last field, followed by alignment at most
+            if 0 <= size and len(data) - 4 < end <= len(data):
+                name = str(data[4 : 4 + name_size], "utf-8", "surrogateescape")
+                return RawScript(name, data, start + 4, end)
+
+    asset = cast("TextAsset", obj.read())
+    script = m_script_to_bytes(asset.m_Script)
+    return RawScript(asset.m_Name, script, 0, len(script))
+
+
 def get_tex_env_by_key(
     src: list[tuple[FastPropertyName, UnityTexEnv]] | list[tuple[str, UnityTexEnv]],
     key: str,
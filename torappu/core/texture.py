@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+from PIL import Image
+from UnityPy.classes import Texture2D
+
+from torappu import get_config
+from torappu.core.bundle import reader_lock
+from torappu.log import logger
+
+config = get_config()
+
+
+def image_size(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class TextureCache:
+    """Process-wide LRU cache of decoded textures, keyed by (file, path_id).
+
+    Path ids are unique within a serialized file, which is named after its
+    CAB and may share its bundle with others.
+
+    Cached images are shared between callers and must not be modified in
+    place; copy them first.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.images: OrderedDict[tuple[str, int], Image.Image] = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def key(texture: Texture2D) -> tuple[str, int] | None:
+        reader = texture.object_reader
+        if reader is None:
+            return None
+
+        return (reader.assets_file.name, reader.path_id)
+
+    def get(self, texture: Texture2D) -> Image.Image:
+        key = self.key(texture)
+        if key is None:
+            return texture.image
+
+        with self.lock:
+            if (image := self.images.get(key)) is not None:
+                self.images.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        # decode outside the lock so different textures decode concurrently
+        with reader_lock(texture.object_reader):  # type: ignore
+            # streamed data is read through a reader of its bundle as well
+            texture.image_data = texture.get_image_data()
+        image = texture.image
+        size = image_size(image)
+        if size > self.max_size:
+            return image
+
+        with self.lock:
+            if key not in self.images:
+                self.images[key] = image
+                self.size += size
+            while self.size > self.max_size:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= image_size(evicted)
+
+        return image
+
+    def report(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        logger.info(
+            f"Texture cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hits / total:.1%} hit rate), {self.size} bytes held"
+        )
+
+
+texture_cache = TextureCache(config.texture_cache_size)
+
+
+class ImageCache:
+    """Process-wide LRU cache of decoded image files, keyed by path.
+
+    Meant for static assets and images exported earlier in the run; an entry
+    is decoded again when the size or modification time of its file changes.
+    Cached images are shared between callers and must not be modified in
+    place; copy them before pasting onto them.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.images: OrderedDict[str, tuple[int, int, Image.Image]] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, path: Path) -> Image.Image:
+        stat = path.stat()
+        key = str(path)
+        with self.lock:
+            if (entry := self.images.get(key)) is not None and entry[:2] == (
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                self.images.move_to_end(key)
+                return entry[2]
+
+        image = Image.open(path)
+        image.load()
+        size = image_size(image)
+        if size > self.max_size:
+            return image
+
+        with self.lock:
+            if (entry := self.images.pop(key, None)) is not None:
+                self.size -= image_size(entry[2])
+            self.images[key] = (stat.st_mtime_ns, stat.st_size, image)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, evicted) = self.images.popitem(last=False)
+                self.size -= image_size(evicted)
+
+        return image
+
+
+image_cache = ImageCache(config.image_cache_size)
+
+
+def decode_texture(texture: Texture2D) -> Image.Image:
+    """Decode `texture` at most once per run, see `TextureCache`"""
+    return texture_cache.get(texture)
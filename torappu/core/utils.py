@@ -1,15 +1,35 @@
+import asyncio
+import multiprocessing
+import os
 from collections.abc import Callable, Coroutine
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial, wraps
-from typing import Any, TypeVar
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import TYPE_CHECKING, Any, TypeVar
 from typing_extensions import ParamSpec
 
 from anyio import from_thread, to_thread
 
+from torappu import get_config
+
+if TYPE_CHECKING:
+    from collections.abc import Buffer
+
 DELIMITERS = r"\. _-"
 
 P = ParamSpec("P")
 R = TypeVar("R")
 
+config = get_config()
+process_executor: ProcessPoolExecutor | None = None
+
+# setting the umask is the only way to read it, so it is read once on import
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+DIR_MODE = 0o777 & ~UMASK
+
 
 def run_sync(func: Callable[P, R]) -> Callable[P, Coroutine[Any, Any, R]]:
     @wraps(func)
@@ -25,3 +45,55 @@ def run_async(func: Callable[P, Coroutine[Any, Any, R]]) -> Callable[P, R]:
         return from_thread.run(partial(func, *args, **kwargs))
 
     return wrapper
+
+
+def init_worker(workers: int):
+    """Split the cache sizes of the config evenly between `workers` processes"""
+    from torappu.core.bundle import dependency_cache
+    from torappu.core.texture import image_cache, texture_cache
+
+    for cache in (dependency_cache, texture_cache, image_cache):
+        cache.max_size //= workers
+
+
+def get_process_executor() -> ProcessPoolExecutor:
+    global process_executor
+    if process_executor is None:
+        workers = config.process_workers or os.cpu_count() or 1
+        # spawn, because forking a process that runs threads is unsafe
+        process_executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(workers,),
+        )
+
+    return process_executor
+
+
+async def run_process(func: Callable[..., R], *args: Any) -> R:
+    """Run `func(*args)` in a worker process.
+
+    `func` must be a module-level function; it, its arguments and its result
+    are pickled.
+    """
+    return await asyncio.wrap_future(get_process_executor().submit(func, *args))
+
+
+def write_atomic(path: Path, data: "Buffer | str"):
+    """Replace `path` with `data` through a temporary file beside it.
+
+    Readers never see a partial file. The result gets the permissions of a
+    newly created file rather than the 0600 of temporary files.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile("wb", dir=path.parent, prefix=".", delete=False) as f:
+        try:
+            f.write(data.encode() if isinstance(data, str) else data)
+            f.close()
+            os.chmod(f.name, FILE_MODE)
+            os.replace(f.name, path)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
@@ -43,3 +43,9 @@ class HotUpdateInfo(BaseModel):
 class Diff(BaseModel):
     type: Literal["create", "update", "delete"]
     path: str
+
+
+class BundleIndex(BaseModel):
+    container: dict[int, str]
+    classes: dict[str, int]
+    scripts: dict[int, str | None] | None = None